@@ -0,0 +1,154 @@
+import asyncio
+import base64
+
+import nonebot
+import nonebot.typing as typing
+import nonebot.permission as permission
+import nonebot.adapters.cqhttp as cqhttp
+import nonebot.adapters.cqhttp.permission as cpermission
+
+from nonebot.plugin import on_command
+
+from .config import Config
+from .constants import InteractionMessage
+from . import card_data, art_store
+
+global_config = nonebot.get_driver().config
+plugin_config = Config(**global_config.dict())
+
+helper = on_command(
+    cmd='help_card',
+    aliases={'卡牌管理'},
+    priority=10
+)
+
+search_card = on_command(
+    cmd='search_card',
+    aliases={'搜索卡牌', 'sc'},
+    priority=4
+)
+
+add_nickname = on_command(
+    cmd='add_nickname',
+    aliases={'添加昵称', 'an'},
+    priority=1
+)
+
+card_cache_status = on_command(
+    cmd='CARD_CACHE',
+    permission=permission.SUPERUSER,
+    priority=1
+)
+
+deduplicate_art = on_command(
+    cmd='ART_DEDUP',
+    permission=permission.SUPERUSER,
+    priority=1
+)
+
+remove_nickname = on_command(
+    cmd='remove_nickname',
+    aliases={'删除昵称', 'rn'},
+    permission=permission.SUPERUSER | cpermission.GROUP_OWNER | cpermission.GROUP_ADMIN,
+    priority=2
+)
+
+
+@helper.handle()
+async def helper_handler(bot: cqhttp.Bot, event: cqhttp.Event):
+    await helper.finish(InteractionMessage.CARD_MANAGER_HELP_MESSAGE)
+
+
+@search_card.handle()
+async def search_card_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    raw_arg = str(event.get_message()).strip()
+    if not raw_arg:
+        await search_card.finish(InteractionMessage.INVALID_ARG)
+
+    match = resolve_card(raw_arg)
+    if match['card_id'] is not None:
+        message = cqhttp.Message(InteractionMessage.CARD_FIND_SUCCESS.format(
+            _card_format(match['card_id'], card_data.name_of(match['card_id']))
+        ))
+        thumbnail = await art_store.thumbnail(match['card_id'])
+        if thumbnail is not None:
+            #   Sent inline, the image segment takes a file name or URI and not raw bytes
+            message.append(cqhttp.MessageSegment.image('base64://' + base64.b64encode(thumbnail).decode()))
+        await search_card.finish(message)
+    elif match['candidates']:
+        await search_card.finish(candidates_message(match['candidates']))
+    else:
+        await search_card.finish(InteractionMessage.CARD_FIND_FAIL.format(raw_arg))
+
+
+@add_nickname.handle()
+async def add_nickname_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    raw_args = str(event.get_message()).strip()
+    arg_list = list(map(str.strip, raw_args.split(plugin_config.separator)))
+    if len(arg_list) != 2 or not arg_list[1]:
+        await add_nickname.finish(InteractionMessage.INVALID_ARG_NUMBER)
+
+    match = resolve_card(arg_list[0])
+    if match['card_id'] is None:
+        if match['candidates']:
+            await add_nickname.finish(candidates_message(match['candidates']))
+        else:
+            await add_nickname.finish(InteractionMessage.CARD_FIND_FAIL.format(arg_list[0]))
+
+    if await card_data.add_nickname(arg_list[1], match['card_id']):
+        await add_nickname.finish(InteractionMessage.NICKNAME_CHANGE_SUCCESS)
+    else:
+        await add_nickname.finish(InteractionMessage.NICKNAME_CHANGE_FAIL)
+
+
+@remove_nickname.handle()
+async def remove_nickname_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    nickname = str(event.get_message()).strip()
+    if not nickname:
+        await remove_nickname.finish(InteractionMessage.INVALID_ARG)
+
+    if await card_data.remove_nickname(nickname):
+        await remove_nickname.finish(InteractionMessage.NICKNAME_CHANGE_SUCCESS)
+    else:
+        await remove_nickname.finish(InteractionMessage.NICKNAME_CHANGE_FAIL)
+
+
+@card_cache_status.handle()
+async def card_cache_status_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    card_stats = card_data.cache_stats()
+    art_stats = art_store.stats()
+
+    await card_cache_status.finish('\n'.join([
+        '{}: {}/{} entries, {} hits, {} misses, {} evictions, {} invalidations'.format(
+            card_stats['name'], card_stats['size'], card_stats['capacity'], card_stats['hits'],
+            card_stats['misses'], card_stats['evictions'], card_stats['invalidations']
+        ),
+        'thumbnail: {} entries, {} bytes, thumbnails {}'.format(
+            art_stats['cached'], art_stats['cached_bytes'], 'on' if art_stats['thumbnails'] else 'off'
+        )
+    ]))
+
+
+#   Move card art written before the ArtStore existed into it
+@deduplicate_art.handle()
+async def deduplicate_art_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    duplicates = await asyncio.get_running_loop().run_in_executor(None, art_store.deduplicate)
+    await deduplicate_art.finish('art deduplicated, {} duplicate files linked'.format(duplicates))
+
+
+#   Resolve a card ID, name, partial name or nickname typed by a member, see DataManager.search
+def resolve_card(text: str) -> dict:
+    if text.isdigit() and card_data.has_id(int(text)):
+        return {'card_id': int(text), 'candidates': []}
+    return card_data.search(text, plugin_config.card_suggestion_size)
+
+
+def candidates_message(candidates: list) -> str:
+    return InteractionMessage.CARD_CANDIDATES + '\n\t' + '\n\t'.join(map(
+        lambda candidate: _card_format(candidate['card_id'], candidate['name']),
+        candidates
+    ))
+
+
+def _card_format(card_id: int, name: str) -> str:
+    return '卡牌ID: {}; 卡牌名: {}'.format(card_id, name)
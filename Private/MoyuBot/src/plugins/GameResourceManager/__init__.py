@@ -1,4 +1,190 @@
+import asyncio
+import datetime
+from pathlib import Path
 
+import nonebot
+import nonebot.typing as typing
+import nonebot.permission as permission
+import nonebot.adapters.cqhttp as cqhttp
 
+from nonebot.plugin import on_command
 
+from .config import Config
+from .data_source import DataManager
+from .art import ArtStore
+from .scraper import Scraper
 
+
+bot_driver = nonebot.get_driver()
+plugin_config = Config(**bot_driver.config.dict())
+
+card_data = DataManager(
+    Path.cwd().joinpath(plugin_config.card_info_storage).joinpath(plugin_config.card_database),
+    plugin_config.card_cache_size
+)
+
+art_store = ArtStore(
+    Path.cwd().joinpath(plugin_config.card_art_storage),
+    plugin_config.art_thumbnail_size,
+    plugin_config.art_cache_bytes
+)
+
+
+async def open_card_data():
+    await card_data.open()
+    art_store.load(await card_data.art_digests())
+
+
+#   Cached card data is dropped whenever a crawl changes the catalogue
+async def reload_card_data(result: dict):
+    await card_data.reload()
+    art_store.load(await card_data.art_digests())
+
+
+scraper = Scraper(
+    str(Path.cwd().joinpath(plugin_config.card_info_storage).joinpath(plugin_config.card_database)),
+    plugin_config.crawl_concurrency,
+    plugin_config.crawl_rate,
+    plugin_config.crawl_timeout,
+    plugin_config.card_batch_size,
+    plugin_config.card_batch_delay
+)
+card_urls = {
+    'data_url': plugin_config.card_data_url,
+    'image_url': plugin_config.card_art_url,
+    'index_url': plugin_config.card_index_url
+}
+card_paths = {'image': Path.cwd().joinpath(plugin_config.card_art_storage)}
+
+#   One sync at a time, the nightly one and CARD_SYNC share the scraper
+sync_lock = asyncio.Lock()
+
+
+async def _crawl_resumable(card_ids=None) -> dict:
+    return await scraper.crawl_resumable(
+        card_urls, card_paths, card_ids,
+        max_attempts=plugin_config.crawl_max_attempts,
+        backoff=plugin_config.crawl_backoff,
+        max_backoff=plugin_config.crawl_max_backoff
+    )
+
+
+#   Bring the card catalogue up to date
+#   A retry job left by an interrupted sync is finished first, then discovery finds the new cards and only
+#   changed cards are written. Cards failing on server trouble become a retry job that survives restarts.
+#   :return: crawl result of the discovery crawl with 'retry', the summary of the retry job if there was one
+async def sync_cards() -> dict:
+    async with sync_lock:
+        await scraper.open()
+        try:
+            await _crawl_resumable()
+
+            frontier = await scraper.discover(
+                card_urls, plugin_config.card_schools, plugin_config.card_characters, plugin_config.card_miss_limit
+            )
+            result = await scraper.crawl(frontier, card_urls, card_paths, incremental=True)
+
+            failed = [card_id for card_id in result['errors'] if isinstance(card_id, int)]
+            result['retry'] = await _crawl_resumable(failed) if failed else None
+            return result
+        finally:
+            await scraper.close()
+
+
+#   Move skills of the file-per-card layout, written before CardSkill, into the database
+async def import_skill_files() -> int:
+    skill_storage = Path.cwd().joinpath(plugin_config.card_skill_storage)
+    if not skill_storage.joinpath('Active').exists():
+        return 0
+
+    async with sync_lock:
+        await scraper.open()
+        try:
+            return await scraper.import_skill_files(
+                str(skill_storage.joinpath('Active')), str(skill_storage.joinpath('Passive'))
+            )
+        finally:
+            await scraper.close()
+
+
+card_sync_task = None
+
+
+async def nightly_sync():
+    while True:
+        hour, minute = map(int, plugin_config.card_sync_time.split(':'))
+        now = datetime.datetime.now()
+        due = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if due <= now:
+            due += datetime.timedelta(days=1)
+        await asyncio.sleep((due - now).total_seconds())
+
+        try:
+            result = await sync_cards()
+            nonebot.logger.info('Card sync: {}'.format(sync_summary(result)))
+        except Exception as e:
+            #   The site may be down for the night, tomorrow's sync catches up
+            nonebot.logger.opt(exception=e).warning('Card sync failed')
+
+
+async def start_nightly_sync():
+    global card_sync_task
+    if plugin_config.card_sync_time:
+        card_sync_task = asyncio.ensure_future(nightly_sync())
+
+
+async def stop_nightly_sync():
+    if card_sync_task is not None:
+        card_sync_task.cancel()
+
+
+def sync_summary(result: dict) -> str:
+    message = '{} cards written, {} without art, {} unchanged, {} missing, {} probes, {} errors'.format(
+        len(result['cards']), len(result['missing_art']), len(result['unchanged']), len(result['missing']),
+        result['discovery']['probes'], len(result['errors'])
+    )
+    if result['retry'] is not None:
+        message += '; retried in {} rounds: {} done, {} missing, {} failed'.format(
+            result['retry']['rounds'], result['retry']['done'], result['retry']['missing'], len(result['retry']['failed'])
+        )
+    return message
+
+
+bot_driver.on_startup(open_card_data)
+bot_driver.on_startup(start_nightly_sync)
+bot_driver.on_shutdown(stop_nightly_sync)
+bot_driver.on_shutdown(card_data.close)
+Scraper.add_sync_listener(reload_card_data)
+
+card_sync = on_command(
+    cmd='CARD_SYNC',
+    permission=permission.SUPERUSER,
+    priority=1
+)
+
+
+#   CARD_SYNC: sync the card catalogue now, CARD_SYNC SKILLS: import skill files of the old layout
+@card_sync.handle()
+async def card_sync_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    if sync_lock.locked():
+        await card_sync.finish('A card sync is already running.')
+
+    if str(event.get_message()).strip().upper() == 'SKILLS':
+        await card_sync.finish('Imported skills of {} cards.'.format(await import_skill_files()))
+
+    await card_sync.send('Card sync started.')
+    try:
+        result = await sync_cards()
+    except Exception as e:
+        await card_sync.finish('Card sync failed: {!r}'.format(e))
+    await card_sync.finish('Card sync finished: {}'.format(sync_summary(result)))
+
+#   Imported after card_data and art_store are created, the command handlers use them
+from . import CardManager
+
+#   Other plugins reach the card catalogue through nonebot.require('GameResourceManager')
+export = nonebot.export()
+export.card_data = card_data
+export.art_store = art_store
+export.resolve_card = CardManager.resolve_card
+export.candidates_message = CardManager.candidates_message
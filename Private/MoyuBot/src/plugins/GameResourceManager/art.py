@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import io
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+import aiofiles
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+#   Card art stored by the SHA-256 of its bytes
+#   root/objects/<digest>.png holds every distinct image once, root/<card_id> stays the path of a card's art
+#   and is a hard link to its object, so dresses sharing the same art share one file.
+#   Thumbnails are generated on first use into root/thumbnails and kept in memory up to cache_bytes.
+#   Without Pillow no thumbnail can be made and the full art is served instead.
+class ArtStore(object):
+
+    def __init__(self, root: Path, thumbnail_size: int = 256, cache_bytes: int = 32 * 1024 * 1024):
+        self._root = Path(root)
+        self._objects = self._root.joinpath('objects')
+        self._thumbnails = self._root.joinpath('thumbnails')
+        self._thumbnail_size = thumbnail_size
+        self._cache_bytes = cache_bytes
+
+        self._digests = {}
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+
+    #   Known digests of card art, e.g. the art hashes of the CardManifest
+    #   :param pairs: (card_id, digest) pairs
+    def load(self, pairs):
+        self._digests = {str(card_id): digest for card_id, digest in pairs if digest}
+
+    #   Store the art of a card, an image already stored under another card is linked instead of written
+    #   :return: {'digest': digest, 'deduplicated': whether the image was already stored}
+    async def put(self, card_id, content: bytes) -> dict:
+        digest = hashlib.sha256(content).hexdigest()
+        target = self._object_path(digest)
+
+        deduplicated = target.exists()
+        if not deduplicated:
+            self._objects.mkdir(parents=True, exist_ok=True)
+            temporary = target.with_suffix('.tmp')
+            async with aiofiles.open(temporary, 'wb') as f:
+                await f.write(content)
+            os.replace(temporary, target)
+
+        self._link(target, self._root.joinpath(str(card_id)))
+        self._digests[str(card_id)] = digest
+        return {'digest': digest, 'deduplicated': deduplicated}
+
+    #   Full art of a card, None if it is not stored
+    async def full(self, card_id) -> bytes:
+        path = self._root.joinpath(str(card_id))
+        if not path.exists():
+            return None
+        async with aiofiles.open(path, 'rb') as f:
+            return await f.read()
+
+    #   Small version of a card's art, None if it is not stored
+    async def thumbnail(self, card_id) -> bytes:
+        digest = await self._digest_of(card_id)
+        if digest is None:
+            return None
+
+        if digest in self._cache:
+            self._cache.move_to_end(digest)
+            return self._cache[digest]
+
+        if Image is None:
+            content = await self.full(card_id)
+        else:
+            path = self._thumbnails.joinpath(digest + '.png')
+            if not path.exists():
+                source = self._object_path(digest)
+                if not source.exists():
+                    #   Art written before the store existed has no object until deduplicate moves it in
+                    source = self._root.joinpath(str(card_id))
+                    if not source.exists():
+                        return None
+                try:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self._make_thumbnail, source, path
+                    )
+                except OSError:
+                    #   Not an image Pillow can read, the card is shown without art
+                    return None
+            async with aiofiles.open(path, 'rb') as f:
+                content = await f.read()
+
+        self._remember(digest, content)
+        return content
+
+    #   Move art files written before the store existed into it, identical images end up as one object
+    #   :return: number of files that were duplicates of an already stored image
+    def deduplicate(self) -> int:
+        duplicates = 0
+        if not self._root.exists():
+            return duplicates
+        for path in self._root.iterdir():
+            if not path.is_file() or path.suffix:
+                continue
+
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            target = self._object_path(digest)
+            if target.exists():
+                if not os.path.samefile(path, target):
+                    duplicates += 1
+            else:
+                self._objects.mkdir(parents=True, exist_ok=True)
+                os.link(path, target)
+
+            self._link(target, path)
+            self._digests[path.name] = digest
+        return duplicates
+
+    def stats(self) -> dict:
+        return {
+            'cached': len(self._cache),
+            'cached_bytes': self._cached_bytes,
+            'thumbnails': Image is not None
+        }
+
+    def _object_path(self, digest: str) -> Path:
+        return self._objects.joinpath(digest + '.png')
+
+    async def _digest_of(self, card_id):
+        digest = self._digests.get(str(card_id))
+        if digest is None:
+            content = await self.full(card_id)
+            if content is None:
+                return None
+            digest = hashlib.sha256(content).hexdigest()
+            self._digests[str(card_id)] = digest
+        return digest
+
+    #   Point path to target, copying if the file system has no hard links
+    @staticmethod
+    def _link(target: Path, path: Path):
+        if path.exists() and os.path.samefile(target, path):
+            return
+
+        temporary = path.with_suffix('.tmp')
+        try:
+            os.link(target, temporary)
+        except OSError:
+            with open(target, 'rb') as source, open(temporary, 'wb') as destination:
+                destination.write(source.read())
+        os.replace(temporary, path)
+
+    def _make_thumbnail(self, source: Path, path: Path):
+        with Image.open(source) as image:
+            image.thumbnail((self._thumbnail_size, self._thumbnail_size))
+            buffer = io.BytesIO()
+            image.save(buffer, format='PNG', optimize=True)
+
+        self._thumbnails.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix('.tmp')
+        with open(temporary, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(temporary, path)
+
+    def _remember(self, digest: str, content: bytes):
+        if len(content) > self._cache_bytes:
+            return
+
+        self._cache[digest] = content
+        self._cached_bytes += len(content)
+        while self._cached_bytes > self._cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= len(evicted)
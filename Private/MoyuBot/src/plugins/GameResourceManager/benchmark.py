@@ -0,0 +1,190 @@
+#   Benchmarks for GameResourceManager
+#   Run as a script from anywhere, e.g.
+#       python benchmark.py skills --cards 1500 --teams 200
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+import aiofiles
+
+if __package__ in (None, ''):
+    #   Load the plugin modules without running the plugin __init__, which needs a nonebot driver
+    _package = types.ModuleType('GameResourceManager')
+    _package.__path__ = [str(Path(__file__).resolve().parent)]
+    sys.modules['GameResourceManager'] = _package
+    __package__ = 'GameResourceManager'
+
+from .data_source import DataManager
+from .model import CARD_SKILL_SCHEMA
+from .skill import pack
+
+TEAM_SIZE = 5
+
+
+#   Latency summary in milliseconds
+def _summary(latencies: list) -> dict:
+    ordered = sorted(latencies)
+    return {
+        'count': len(ordered),
+        'p50': round(statistics.median(ordered) * 1000, 3),
+        'p99': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+        'max': round(ordered[-1] * 1000, 3)
+    }
+
+
+#   Drop a file from the page cache, so the next read comes from the disk
+def _evict(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+#   Skill data shaped like the act, groupSkills and skills fields of the karth.top dress JSON
+def _skill(rng: random.Random, card_id: int) -> dict:
+    def text(words: int) -> dict:
+        return {
+            'ja': ''.join(rng.choice('アイウエオカキクケコ攻撃力防御回復付与') for _ in range(words * 3)),
+            'en': ' '.join('word{}'.format(rng.randrange(500)) for _ in range(words))
+        }
+
+    def act() -> dict:
+        return {
+            'name': text(3),
+            'description': text(25),
+            'cost': rng.randint(1, 4),
+            'icon': rng.randrange(1, 200),
+            'hit': rng.randint(1, 5),
+            'params': [{'type': rng.randrange(100), 'value': rng.randrange(10000), 'turn': rng.randint(1, 3)}
+                       for _ in range(rng.randint(2, 5))]
+        }
+
+    return {
+        'active': {'act1': act(), 'act2': act(), 'act3': act(), 'climax': act()},
+        'passive': {
+            'auto_skill': [act() for _ in range(3)],
+            'unit_skill': act(),
+            'finish_act': act()
+        }
+    }
+
+
+def _populate(root: Path, cards: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    card_ids = [1010001 + i for i in range(cards)]
+
+    active_directory = root.joinpath('Skill').joinpath('Active')
+    passive_directory = root.joinpath('Skill').joinpath('Passive')
+    active_directory.mkdir(parents=True)
+    passive_directory.mkdir(parents=True)
+
+    conn = sqlite3.connect(root.joinpath('Card.db'))
+    conn.execute(CARD_SKILL_SCHEMA)
+    rows = []
+    for card_id in card_ids:
+        skill = _skill(rng, card_id)
+        #   The file-per-card layout written by the scraper before CardSkill
+        active_directory.joinpath(str(card_id)).write_text(json.dumps(skill['active']))
+        passive_directory.joinpath(str(card_id)).write_text(json.dumps(skill['passive']))
+        rows.append((card_id, pack(skill['active']), pack(skill['passive'])))
+    conn.executemany('INSERT INTO CardSkill (card_id, active, passive) VALUES (?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+    return card_ids
+
+
+#   Team skills read from the file-per-card layout, two files per card
+async def _load_files(root: Path, team: list) -> dict:
+    result = {}
+    for card_id in team:
+        async with aiofiles.open(root.joinpath('Skill').joinpath('Active').joinpath(str(card_id)), 'r') as f:
+            active = json.loads(await f.read())
+        async with aiofiles.open(root.joinpath('Skill').joinpath('Passive').joinpath(str(card_id)), 'r') as f:
+            passive = json.loads(await f.read())
+        result[card_id] = {'active': active, 'passive': passive}
+    return result
+
+
+def _directory_bytes(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.rglob('*') if file.is_file())
+
+
+async def bench_skills(args) -> dict:
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        root = Path(directory)
+        card_ids = _populate(root, args.cards, args.seed)
+        teams = [rng.sample(card_ids, TEAM_SIZE) for _ in range(args.teams)]
+
+        data_manager = DataManager(root.joinpath('Card.db'))
+        await data_manager.open()
+
+        files = {'cold': [], 'warm': []}
+        store = {'cold': [], 'warm': [], 'cached': []}
+        for team in teams:
+            #   Cold: nothing of this team in the page cache or in memory
+            for card_id in team:
+                _evict(root.joinpath('Skill').joinpath('Active').joinpath(str(card_id)))
+                _evict(root.joinpath('Skill').joinpath('Passive').joinpath(str(card_id)))
+            _evict(root.joinpath('Card.db'))
+            data_manager._cache.invalidate()
+
+            for phase in ('cold', 'warm'):
+                start = time.perf_counter()
+                expected = await _load_files(root, team)
+                files[phase].append(time.perf_counter() - start)
+
+                if phase == 'warm':
+                    data_manager._cache.invalidate()
+                start = time.perf_counter()
+                loaded = await data_manager.skills(team)
+                store[phase].append(time.perf_counter() - start)
+                assert loaded == expected
+
+            start = time.perf_counter()
+            await data_manager.skills(team)
+            store['cached'].append(time.perf_counter() - start)
+
+        await data_manager.close()
+
+        return {
+            'cards': args.cards,
+            'teams': args.teams,
+            'bytes': {
+                'files': _directory_bytes(root.joinpath('Skill')),
+                'store': root.joinpath('Card.db').stat().st_size
+            },
+            'files': {phase: _summary(latencies) for phase, latencies in files.items()},
+            'store': {phase: _summary(latencies) for phase, latencies in store.items()}
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GameResourceManager benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    skills = subparsers.add_parser('skills', help='team skill loading, file-per-card layout against CardSkill')
+    skills.add_argument('--cards', type=int, default=1500)
+    skills.add_argument('--teams', type=int, default=200)
+    skills.add_argument('--seed', type=int, default=0)
+    skills.set_defaults(run=bench_skills)
+
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(args.run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
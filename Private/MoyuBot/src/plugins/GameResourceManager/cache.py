@@ -0,0 +1,87 @@
+import asyncio
+from collections import OrderedDict
+
+
+#   Least recently used cache for results of coroutine loaders
+#   Concurrent misses on the same key share one load, and a load that started before an invalidation
+#   is returned to its callers but not stored, so invalidated data never comes back.
+class AsyncLRU(object):
+
+    def __init__(self, name: str, capacity: int = 1024):
+        self.name = name
+        self.capacity = max(1, int(capacity))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._generation = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    #   Changes on every invalidation, a value loaded under an older generation must not be put
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    #   Cached value of key, or the result of await loader() which is then cached
+    async def get(self, key, loader):
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        self.misses += 1
+        if key in self._loading:
+            return await asyncio.shield(self._loading[key])
+
+        generation = self._generation
+        future = asyncio.ensure_future(loader())
+        self._loading[key] = future
+        try:
+            value = await asyncio.shield(future)
+        finally:
+            if self._loading.get(key) is future:
+                del self._loading[key]
+
+        if generation == self._generation:
+            self.put(key, value)
+        return value
+
+    #   Cached value of key without loading, default if it is not cached
+    def peek(self, key, default=None):
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    #   Drop every entry
+    def invalidate(self):
+        self._entries.clear()
+        self._loading.clear()
+        self._generation += 1
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'size': len(self._entries),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
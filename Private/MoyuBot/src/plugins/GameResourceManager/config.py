@@ -7,7 +7,34 @@ class Config(BaseSettings):
     memoir_storage: str = 'Data/Memoir'
     other_storage: str = 'Data/Other'
 
-    max_card_number: int = 30
+    card_database: str = 'Card.db'
+    card_cache_size: int = 1024
+    card_art_storage: str = 'Data/Card/Art'
+    art_thumbnail_size: int = 256
+    art_cache_bytes: int = 32 * 1024 * 1024
+
+    card_suggestion_size: int = 5
+
+    #   Card discovery probes each school and character until card_miss_limit missing numbers in a row
+    card_schools: list = [1, 2, 3, 4, 5]
+    card_characters: list = [1, 2, 3, 4, 5, 6, 7, 8, 9]
+    card_miss_limit: int = 3
+
+    separator: str = ','
+
+    card_data_url: str = 'https://karth.top/api/dress/{}.json'
+    card_index_url: str = 'https://karth.top/api/dress.json'
+    card_art_url: str = 'https://api.karen.makoo.eu/api/assets/dlc/res/dress/cg/{}/image.png'
+    crawl_concurrency: int = 8
+    crawl_rate: float = 10.0
+    crawl_timeout: float = 30.0
+    card_batch_size: int = 50
+    card_batch_delay: float = 1.0
+    crawl_max_attempts: int = 5
+    crawl_backoff: float = 2.0
+    crawl_max_backoff: float = 300.0
+    #   Local time of a nightly card sync, e.g. '05:00', empty to sync only on CARD_SYNC
+    card_sync_time: str = ''
 
     class Config:
         extra = 'ignore'
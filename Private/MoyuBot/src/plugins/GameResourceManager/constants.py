@@ -1,6 +1,25 @@
 from enum import Enum
 
 
+class InteractionMessage:
+    NICKNAME_CHANGE_SUCCESS = '已更新昵称。'
+    NICKNAME_CHANGE_FAIL = '昵称更新失败。'
+    CARD_FIND_SUCCESS = '找到卡牌：{}'
+    CARD_FIND_FAIL = '未找到卡牌：{}。'
+    CARD_CANDIDATES = '可能的卡牌如下，请使用卡牌ID：'
+
+    INVALID_ARG = '非法参数！请重新输入！'
+    INVALID_ARG_NUMBER = '参数数量错误！请重新输入！'
+
+    CARD_MANAGER_HELP_MESSAGE = '''
+    卡牌管理：
+    0. 使用英文逗号","作为参数分隔符，请遵循参数输入顺序
+    1. /搜索卡牌|sc 卡牌名(可不完整)|昵称|卡牌ID
+    2. /添加昵称|an 卡牌名|卡牌ID,昵称
+    3. /删除昵称|rn 昵称（仅限管理使用）
+    '''.strip()
+
+
 #   Database Status Code
 class DBSCode(Enum):
     SUCCESS = 200
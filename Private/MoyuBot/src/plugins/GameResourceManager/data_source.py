@@ -1,8 +1,164 @@
 import aiosqlite
 from pathlib import Path
 
+from .model import (
+    CARD_INFO_SCHEMA, CARD_INFO_INDEXES, CARD_INFO_COLUMNS,
+    CARD_MANIFEST_SCHEMA, CARD_NICKNAME_SCHEMA, CARD_SKILL_SCHEMA
+)
+from .cache import AsyncLRU
+from .search import CardNameIndex
+from .skill import unpack
 
+
+#   Read-only query layer over the CardInfo table filled by the Scraper
+#   Lookups use fixed statements, so sqlite keeps them prepared in the connection's statement cache
 class DataManager:
+    _LOOKUPS = {
+        'id': 'SELECT * FROM CardInfo WHERE id = ?',
+        'name': 'SELECT * FROM CardInfo WHERE name = ?',
+        'character': 'SELECT * FROM CardInfo WHERE char_id = ? ORDER BY id',
+        'school': 'SELECT * FROM CardInfo WHERE school_id = ? ORDER BY id',
+        'rarity': 'SELECT * FROM CardInfo WHERE rarity = ? ORDER BY id',
+        'role': 'SELECT * FROM CardInfo WHERE role = ? ORDER BY id'
+    }
+
+    def __init__(self, database: Path, cache_size: int = 1024):
+        self._database = database
+        self._conn = None
+
+        #   Names and nicknames of every card, for resolving user input without a query
+        self._name_index = CardNameIndex()
+        #   (lookup, value) -> result of lookups, card stats only change when the catalogue is synced
+        self._cache = AsyncLRU('card', cache_size)
+
+    @property
+    def size(self) -> int:
+        return len(self._name_index)
+
+    #   Open the card database once, the Scraper may not have created it yet
+    async def open(self):
+        if self._conn is not None:
+            return
+
+        Path(self._database).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = await aiosqlite.connect(self._database)
+        await self._conn.execute(CARD_INFO_SCHEMA)
+        for index in CARD_INFO_INDEXES:
+            await self._conn.execute(index)
+        await self._conn.execute(CARD_MANIFEST_SCHEMA)
+        await self._conn.execute(CARD_NICKNAME_SCHEMA)
+        await self._conn.execute(CARD_SKILL_SCHEMA)
+        await self._conn.commit()
+
+        await self.reload()
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    #   Rebuild the name index and drop cached results, must be called after the catalogue changes
+    async def reload(self):
+        async with self._conn.execute('SELECT id, name FROM CardInfo') as cursor:
+            cards = await cursor.fetchall()
+        async with self._conn.execute('SELECT nickname, card_id FROM CardNickname') as cursor:
+            nicknames = await cursor.fetchall()
+
+        self._name_index.build(cards, nicknames)
+        self._cache.invalidate()
+
+    def cache_stats(self) -> dict:
+        return self._cache.stats()
+
+    def has_id(self, card_id: int) -> bool:
+        return self._name_index.has_id(card_id)
+
+    def has_name(self, name: str) -> bool:
+        return self._name_index.exact(name) is not None
+
+    #   Card id of an exact card name or nickname, None if there is no such card
+    def resolve_name(self, name: str):
+        return self._name_index.exact(name)
+
+    def name_of(self, card_id: int):
+        return self._name_index.name_of(card_id)
+
+    #   Resolve a possibly partial or misspelled card name, see CardNameIndex.search
+    def search(self, text: str, k: int = 5) -> dict:
+        return self._name_index.search(text, k)
+
+    #   Skills of several cards, e.g. a whole team, read with one query
+    #   :return: {card_id: {'active': dict, 'passive': dict}}, cards without stored skills are left out
+    async def skills(self, card_ids) -> dict:
+        result = {}
+        missing = []
+        for card_id in map(int, card_ids):
+            skill = self._cache.peek(('skill', card_id))
+            if skill is not None:
+                result[card_id] = skill
+            else:
+                missing.append(card_id)
+
+        if missing:
+            generation = self._cache.generation
+            statement = 'SELECT card_id, active, passive FROM CardSkill WHERE card_id IN ({})'.format(
+                ', '.join(['?'] * len(missing))
+            )
+            async with self._conn.execute(statement, missing) as cursor:
+                async for card_id, active, passive in cursor:
+                    result[card_id] = {'active': unpack(active), 'passive': unpack(passive)}
+                    if generation == self._cache.generation:
+                        self._cache.put(('skill', card_id), result[card_id])
+
+        return result
+
+    #   (card_id, digest) of every stored card art, for the ArtStore
+    async def art_digests(self) -> list:
+        async with self._conn.execute('SELECT card_id, art_hash FROM CardManifest') as cursor:
+            return await cursor.fetchall()
+
+    #   Add or replace a nickname of a card, False if the card does not exist
+    async def add_nickname(self, nickname: str, card_id: int) -> bool:
+        if not self._name_index.has_id(card_id):
+            return False
+
+        await self._conn.execute(
+            'INSERT OR REPLACE INTO CardNickname (nickname, card_id) VALUES (?, ?)', (nickname, card_id)
+        )
+        await self._conn.commit()
+        self._name_index.put_nickname(nickname, card_id)
+        return True
+
+    #   Remove a nickname, False if there is no such nickname
+    async def remove_nickname(self, nickname: str) -> bool:
+        cursor = await self._conn.execute('DELETE FROM CardNickname WHERE nickname = ?', (nickname,))
+        await self._conn.commit()
+        self._name_index.remove_nickname(nickname)
+        return cursor.rowcount > 0
+
+    async def get(self, card_id: int) -> dict:
+        result = await self._lookup('id', int(card_id))
+        return result[0] if result else None
+
+    async def by_name(self, name: str) -> dict:
+        result = await self._lookup('name', str(name))
+        return result[0] if result else None
+
+    async def by_character(self, char_id: int) -> list:
+        return await self._lookup('character', int(char_id))
+
+    async def by_school(self, school_id: int) -> list:
+        return await self._lookup('school', int(school_id))
+
+    async def by_rarity(self, rarity: int) -> list:
+        return await self._lookup('rarity', int(rarity))
+
+    async def by_role(self, role: str) -> list:
+        return await self._lookup('role', str(role))
+
+    async def _lookup(self, lookup: str, value) -> list:
+        async def load():
+            async with self._conn.execute(self._LOOKUPS[lookup], (value,)) as cursor:
+                return [dict(zip(CARD_INFO_COLUMNS, row)) async for row in cursor]
 
-    def __init__(self, database: Path):
-        self._conn = aiosqlite.connect(database)
+        return await self._cache.get((lookup, value), load)
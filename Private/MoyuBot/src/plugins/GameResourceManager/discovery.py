@@ -0,0 +1,82 @@
+import asyncio
+from collections import deque
+
+
+#   Card ids are school * 1e6 + character * 1e4 + number, cards of one character are numbered from 1 up
+def card_id_of(school: int, character: int, number: int) -> int:
+    return school * 1000000 + character * 10000 + number
+
+
+#   (school, character), number of a card id
+def lane_of(card_id: int) -> tuple:
+    return (card_id // 1000000, card_id // 10000 % 100), card_id % 10000
+
+
+#   Card ids to crawl, handed out while crawling instead of listed up front
+#   Known cards (of the previous sync or an index listing) are crawled again, then each (school, character)
+#   is probed past its highest existing number until miss_limit numbers in a row do not exist.
+#   Probes of a lane run concurrently but never further than miss_limit past its highest hit,
+#   so requests grow with the real cards and not with the id grid.
+class CardFrontier(object):
+
+    def __init__(self, known=(), lanes=(), miss_limit: int = 3):
+        self._miss_limit = max(1, int(miss_limit))
+        self._known = deque(sorted(set(known)))
+        self._highest = {lane: 0 for lane in lanes}
+        self._next = {}
+        for card_id in self._known:
+            lane, number = lane_of(card_id)
+            self._highest[lane] = max(self._highest.get(lane, 0), number)
+        for lane, highest in self._highest.items():
+            self._next[lane] = highest + 1
+
+        self._in_flight = 0
+        self._changed = asyncio.Event()
+        self.probes = 0
+        self.misses = 0
+
+    #   Exactly these ids, without probing
+    @classmethod
+    def of(cls, card_ids):
+        frontier = cls()
+        frontier._known = deque(card_ids)
+        return frontier
+
+    #   Next id to crawl, None if nothing can be handed out until an id in flight is reported
+    def next(self):
+        if self._known:
+            self._in_flight += 1
+            return self._known.popleft()
+
+        for lane, number in self._next.items():
+            if number <= self._highest[lane] + self._miss_limit:
+                self._next[lane] = number + 1
+                self._in_flight += 1
+                self.probes += 1
+                return card_id_of(*lane, number)
+        return None
+
+    #   Outcome of a handed out id, found is False only when the card does not exist
+    def report(self, card_id: int, found: bool):
+        self._in_flight -= 1
+        lane, number = lane_of(card_id)
+        if lane in self._highest:
+            if found:
+                self._highest[lane] = max(self._highest[lane], number)
+            else:
+                self.misses += 1
+        self._changed.set()
+
+    #   Nothing left to hand out and nothing in flight that could open more probes
+    @property
+    def finished(self) -> bool:
+        return self._in_flight == 0 and not self._known and all(
+            number > self._highest[lane] + self._miss_limit for lane, number in self._next.items()
+        )
+
+    async def wait(self):
+        self._changed.clear()
+        await self._changed.wait()
+
+    def stats(self) -> dict:
+        return {'probes': self.probes, 'misses': self.misses, 'highest': dict(self._highest)}
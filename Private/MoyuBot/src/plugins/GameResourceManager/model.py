@@ -0,0 +1,168 @@
+#   Card database schema
+#   Column order of CardInfo follows Scraper._split
+
+CARD_INFO_COLUMNS = [
+    'id',
+    'name',
+    'release',
+    'char_id',
+    'school_id',
+    'rarity',
+    'class',
+    'attack_type',
+    'role',
+    'position',
+    'total',
+    'speed',
+    'attack',
+    'health',
+    'magic_def',
+    'physical_def',
+    'critical_chance',
+    'critical_damage'
+]
+
+CARD_INFO_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS CardInfo (
+id INTEGER PRIMARY KEY,
+name TEXT,
+release INTEGER,
+char_id INTEGER,
+school_id INTEGER,
+rarity INTEGER,
+class INTEGER,
+attack_type INTEGER,
+role TEXT,
+position INTEGER,
+total INTEGER,
+speed INTEGER,
+attack INTEGER,
+health INTEGER,
+magic_def INTEGER,
+physical_def INTEGER,
+critical_chance INTEGER,
+critical_damage INTEGER)
+'''
+
+#   One index per DataManager lookup other than id, which is the primary key
+CARD_INFO_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS ix_CardInfo_name ON CardInfo (name)',
+    'CREATE INDEX IF NOT EXISTS ix_CardInfo_char_id ON CardInfo (char_id)',
+    'CREATE INDEX IF NOT EXISTS ix_CardInfo_school_id ON CardInfo (school_id)',
+    'CREATE INDEX IF NOT EXISTS ix_CardInfo_rarity ON CardInfo (rarity)',
+    'CREATE INDEX IF NOT EXISTS ix_CardInfo_role ON CardInfo (role)'
+]
+
+CARD_INFO_UPSERT = '''
+INSERT INTO CardInfo (
+id,
+name,
+release,
+char_id,
+school_id,
+rarity,
+class,
+attack_type,
+role,
+position,
+total,
+speed,
+attack,
+health,
+magic_def,
+physical_def,
+critical_chance,
+critical_damage)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+name = excluded.name,
+release = excluded.release,
+char_id = excluded.char_id,
+school_id = excluded.school_id,
+rarity = excluded.rarity,
+class = excluded.class,
+attack_type = excluded.attack_type,
+role = excluded.role,
+position = excluded.position,
+total = excluded.total,
+speed = excluded.speed,
+attack = excluded.attack,
+health = excluded.health,
+magic_def = excluded.magic_def,
+physical_def = excluded.physical_def,
+critical_chance = excluded.critical_chance,
+critical_damage = excluded.critical_damage
+'''
+
+
+#   Validators and content hashes of the last grabbed version of every card,
+#   used to send conditional requests and to skip writing unchanged cards
+CARD_MANIFEST_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS CardManifest (
+card_id INTEGER PRIMARY KEY,
+etag TEXT,
+last_modified TEXT,
+content_hash TEXT,
+art_etag TEXT,
+art_last_modified TEXT,
+art_hash TEXT,
+synced_at INTEGER)
+'''
+
+CARD_MANIFEST_UPSERT = '''
+INSERT INTO CardManifest (
+card_id,
+etag,
+last_modified,
+content_hash,
+art_etag,
+art_last_modified,
+art_hash,
+synced_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (card_id) DO UPDATE SET
+etag = excluded.etag,
+last_modified = excluded.last_modified,
+content_hash = excluded.content_hash,
+art_etag = excluded.art_etag,
+art_last_modified = excluded.art_last_modified,
+art_hash = excluded.art_hash,
+synced_at = excluded.synced_at
+'''
+
+
+#   Nicknames members use for cards, maintained through the nickname commands
+CARD_NICKNAME_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS CardNickname (
+nickname TEXT PRIMARY KEY,
+card_id INTEGER)
+'''
+
+
+#   Active and passive skills of every card, packed by skill.pack
+CARD_SKILL_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS CardSkill (
+card_id INTEGER PRIMARY KEY,
+active BLOB,
+passive BLOB)
+'''
+
+CARD_SKILL_UPSERT = '''
+INSERT INTO CardSkill (card_id, active, passive)
+VALUES (?, ?, ?)
+ON CONFLICT (card_id) DO UPDATE SET
+active = excluded.active,
+passive = excluded.passive
+'''
+
+
+#   State of every card of the current crawl job, so an interrupted crawl resumes where it stopped
+#   status is one of pending, done, missing, failed
+CRAWL_CHECKPOINT_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS CrawlCheckpoint (
+card_id INTEGER PRIMARY KEY,
+status TEXT,
+attempts INTEGER DEFAULT 0,
+last_error TEXT,
+updated_at INTEGER)
+'''
@@ -3,28 +3,336 @@ import json
 import aiofiles
 import aiohttp
 import aiosqlite
+import hashlib
+import time
 import traceback
+from pathlib import Path
 
 from .constants import DBSCode
-
-
+from .model import (
+    CARD_INFO_SCHEMA, CARD_INFO_INDEXES, CARD_INFO_UPSERT,
+    CARD_MANIFEST_SCHEMA, CARD_MANIFEST_UPSERT,
+    CARD_SKILL_SCHEMA, CARD_SKILL_UPSERT,
+    CRAWL_CHECKPOINT_SCHEMA
+)
+from .throttle import Throttle
+from .art import ArtStore
+from .skill import pack
+from .discovery import CardFrontier, lane_of
+
+
+#   Use singleton to share one database connection and one HTTP session
+#   :param concurrency: maximum number of requests in flight per host
+#   :param rate: maximum number of requests per second per host, 0 for no limit
+#   :param batch_size, batch_delay: crawled cards are committed once this many are buffered,
+#       or when no card arrived for batch_delay seconds
 class Scraper(object):
     __instance = None
+    __sync_listeners = []
 
-    def __new__(cls, db_path: str):
+    def __new__(cls, db_path: str, concurrency: int = 8, rate: float = 10.0, timeout: float = 30.0,
+                batch_size: int = 50, batch_delay: float = 1.0):
         if cls.__instance is None:
             cls.__instance = object.__new__(cls)
-            cls.__conn = aiosqlite.connect(db_path, isolation_level='IMMEDIATE')
+            cls.__db_path = db_path
+            cls.__concurrency = max(1, int(concurrency))
+            cls.__timeout = timeout
+            cls.__batch_size = max(1, int(batch_size))
+            cls.__batch_delay = batch_delay
+            cls.__conn = None
+            cls.__session = None
+            #   Card data and card art are served by different hosts, each gets its own limits
+            cls.__info_throttle = Throttle(concurrency, rate)
+            cls.__art_throttle = Throttle(concurrency, rate)
         return cls.__instance
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, concurrency: int = 8, rate: float = 10.0, timeout: float = 30.0,
+                 batch_size: int = 50, batch_delay: float = 1.0):
         pass
 
+    #   Connect to the card database and open the pooled HTTP session, must be done before grabbing
+    async def open(self):
+        cls = type(self)
+        if cls.__conn is None:
+            cls.__conn = await aiosqlite.connect(cls.__db_path, isolation_level='IMMEDIATE')
+            await cls.__conn.execute(CARD_INFO_SCHEMA)
+            for index in CARD_INFO_INDEXES:
+                await cls.__conn.execute(index)
+            await cls.__conn.execute(CARD_MANIFEST_SCHEMA)
+            await cls.__conn.execute(CARD_SKILL_SCHEMA)
+            await cls.__conn.execute(CRAWL_CHECKPOINT_SCHEMA)
+            await cls.__conn.commit()
+
+        if cls.__session is None:
+            cls.__session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=cls.__concurrency * 2),
+                timeout=aiohttp.ClientTimeout(total=cls.__timeout)
+            )
+
+    async def close(self):
+        cls = type(self)
+        if cls.__session is not None:
+            await cls.__session.close()
+            cls.__session = None
+        if cls.__conn is not None:
+            await cls.__conn.close()
+            cls.__conn = None
+
+    #   Crawl a job of cards that survives restarts, see CrawlCheckpoint
+    #   Cards are marked done in the same transaction that writes them, so finished cards are never grabbed again.
+    #   Failed cards are retried in further rounds, waiting backoff * 2^(round - 1) seconds (at most max_backoff)
+    #   before each, until they succeed or failed max_attempts times.
+    #   :param card_ids: cards of a new job replacing the stored one, None to resume the stored job
+    #   :param incremental: see crawl, on by default so that resuming only probes cards already grabbed
+    #   :return: {'rounds', 'done', 'missing', 'pending', 'failed': {card_id: last error}}
+    async def crawl_resumable(self, urls: dict, paths: dict, card_ids=None, incremental: bool = True,
+                              max_attempts: int = 5, backoff: float = 2.0, max_backoff: float = 300.0):
+        if card_ids is not None:
+            await self.__conn.execute('DELETE FROM CrawlCheckpoint')
+            await self.__conn.executemany(
+                "INSERT OR IGNORE INTO CrawlCheckpoint (card_id, status, updated_at) VALUES (?, 'pending', ?)",
+                [(int(card_id), int(time.time())) for card_id in card_ids]
+            )
+            await self.__conn.commit()
+
+        rounds = 0
+        while True:
+            async with self.__conn.execute(
+                "SELECT card_id FROM CrawlCheckpoint "
+                "WHERE status = 'pending' OR (status = 'failed' AND attempts < ?) ORDER BY card_id",
+                (max_attempts,)
+            ) as cursor:
+                remaining = [card_id for card_id, in await cursor.fetchall()]
+            if not remaining:
+                break
+
+            if rounds:
+                await asyncio.sleep(min(backoff * 2 ** (rounds - 1), max_backoff))
+            rounds += 1
+
+            result = await self.crawl(remaining, urls, paths, incremental)
+            await self._write_checkpoint(result)
+
+        summary = {'rounds': rounds, 'done': 0, 'missing': 0, 'pending': 0, 'failed': {}}
+        async with self.__conn.execute('SELECT card_id, status, last_error FROM CrawlCheckpoint') as cursor:
+            async for card_id, status, last_error in cursor:
+                if status == 'failed':
+                    summary['failed'][card_id] = last_error
+                else:
+                    summary[status] += 1
+        return summary
+
+    #   Register a coroutine function called with the crawl result after every crawl that changed cards,
+    #   e.g. to drop cached card data
+    @classmethod
+    def add_sync_listener(cls, listener):
+        cls.__sync_listeners.append(listener)
+
+    #   Grab a list of cards through a pipeline of three stages connected by queues:
+    #   card data requests, card art requests, then database and art writes by a single writer
+    #   :param urls: data_url and image_url templates, formatted with the card_id
+    #   :param paths: image storing directory
+    #   :param incremental: send conditional requests based on the CardManifest,
+    #       cards whose data did not change are neither written nor have their art requested
+    #   :return: {'cards': [(card_id, name)], 'unchanged': [card_id], 'missing': [card_id],
+    #       'errors': {card_id or sync listener name: traceback}, 'batches': [{'size', 'seconds'}],
+    #       'deduplicated': number of cards whose art was already stored under another card,
+    #       'missing_art': [card_id] of cards written without art}
+    async def crawl(self, card_ids, urls: dict, paths: dict, incremental: bool = False):
+        cls = type(self)
+        result = {'cards': [], 'unchanged': [], 'missing': [], 'errors': {}, 'batches': [], 'deduplicated': 0,
+                  'missing_art': []}
+        art_store = ArtStore(paths['image'])
+        manifest = await self._read_manifest() if incremental else {}
+
+        frontier = card_ids if isinstance(card_ids, CardFrontier) else CardFrontier.of(card_ids)
+        #   Bounded, so the fetchers wait for the writer instead of holding every card in memory
+        art_queue = asyncio.Queue(maxsize=cls.__concurrency * 2)
+        write_queue = asyncio.Queue(maxsize=cls.__concurrency * 2)
+
+        async def fetch_info():
+            while not frontier.finished:
+                card_id = frontier.next()
+                if card_id is None:
+                    await frontier.wait()
+                    continue
+
+                entry = manifest.get(card_id, {})
+                found = True
+                try:
+                    raw_data = await self._fetch_card_info(
+                        urls['data_url'].format(card_id), entry.get('etag'), entry.get('last_modified')
+                    )
+
+                    if raw_data['status'] == 304 or (raw_data['result'] and raw_data['hash'] == entry.get('content_hash')):
+                        result['unchanged'].append(card_id)
+                        if raw_data['status'] != 304:
+                            #   Same content under new validators, only the manifest is refreshed
+                            row = dict(entry, etag=raw_data['etag'], last_modified=raw_data['last_modified'])
+                            await write_queue.put((card_id, None, None, row))
+                    elif raw_data['result']:
+                        row = dict(
+                            entry,
+                            card_id=card_id,
+                            etag=raw_data['etag'],
+                            last_modified=raw_data['last_modified'],
+                            content_hash=raw_data['hash']
+                        )
+                        await art_queue.put((card_id, self._split(raw_data['result']), row))
+                    elif raw_data['status'] == 404:
+                        found = False
+                        result['missing'].append(card_id)
+                    else:
+                        #   Server trouble, the card may exist and is worth retrying
+                        result['errors'][card_id] = 'HTTP {}'.format(raw_data['status'])
+                except Exception as e:
+                    result['errors'][card_id] = traceback.format_exc()
+                finally:
+                    frontier.report(card_id, found)
+
+        async def fetch_art():
+            while True:
+                item = await art_queue.get()
+                if item is None:
+                    return
+
+                card_id, card, row = item
+                try:
+                    image_content = await self._fetch_card_art(
+                        urls['image_url'].format(card_id), row.get('art_etag'), row.get('art_last_modified')
+                    )
+                    if image_content['status'] not in (200, 304, 404):
+                        result['errors'][card_id] = 'HTTP {}'.format(image_content['status'])
+                        continue
+
+                    if image_content['status'] == 404 and not row.get('art_hash'):
+                        #   Art is often published after the card, without validators the next sync
+                        #   gets the card data again and asks for its art once more
+                        result['missing_art'].append(card_id)
+                        row.update(etag=None, last_modified=None, content_hash=None)
+
+                    image = image_content['image']
+                    if image is not None:
+                        if image_content['hash'] == row.get('art_hash'):
+                            #   Identical art, keep the stored file
+                            image = None
+                        row.update(
+                            art_etag=image_content['etag'],
+                            art_last_modified=image_content['last_modified'],
+                            art_hash=image_content['hash']
+                        )
+                    await write_queue.put((card_id, card, image, row))
+                except Exception as e:
+                    result['errors'][card_id] = traceback.format_exc()
+
+        #   Cards are written in batches, each batch of CardInfo, CardSkill and CardManifest rows is one transaction
+        #   Art is written before its card is committed, a card without published art is committed without it
+        pending = []
+
+        async def flush():
+            if not pending:
+                return
+
+            start = time.perf_counter()
+            status = await self._write_cards(
+                [card['stats'] for _, card, _ in pending if card is not None],
+                [row for _, _, row in pending],
+                [self._skill_row(card_id, card) for card_id, card, _ in pending if card is not None]
+            )
+            result['batches'].append({'size': len(pending), 'seconds': time.perf_counter() - start})
+
+            for card_id, card, _ in pending:
+                if status['status'] != DBSCode.SUCCESS:
+                    result['errors'][card_id] = str(status['error_message'])
+                elif card is not None:
+                    result['cards'].append((card_id, card['stats'][1]))
+            pending.clear()
+
+        async def write():
+            while True:
+                try:
+                    item = await asyncio.wait_for(write_queue.get(), cls.__batch_delay)
+                except asyncio.TimeoutError:
+                    #   Fetching is slower than writing, do not hold the buffered cards any longer
+                    await flush()
+                    continue
+
+                if item is None:
+                    await flush()
+                    return
+
+                card_id, card, image, row = item
+                try:
+                    if card is not None and image is not None:
+                        stored = await art_store.put(card_id, image)
+                        result['deduplicated'] += stored['deduplicated']
+                except Exception as e:
+                    result['errors'][card_id] = traceback.format_exc()
+                    continue
+
+                pending.append((card_id, card, row))
+                if len(pending) >= cls.__batch_size:
+                    await flush()
+
+        info_workers = [asyncio.ensure_future(fetch_info()) for _ in range(cls.__concurrency)]
+        art_workers = [asyncio.ensure_future(fetch_art()) for _ in range(cls.__concurrency)]
+        writer = asyncio.ensure_future(write())
+
+        async def fetch():
+            await asyncio.gather(*info_workers)
+            for _ in art_workers:
+                await art_queue.put(None)
+            await asyncio.gather(*art_workers)
+            await write_queue.put(None)
+
+        fetcher = asyncio.ensure_future(fetch())
+        try:
+            #   A failed writer would leave the fetchers blocked on its full queue, its error ends the crawl
+            done, _ = await asyncio.wait([fetcher, writer], return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+            await writer
+        finally:
+            tasks = info_workers + art_workers + [fetcher, writer]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        result['discovery'] = frontier.stats()
+        if result['cards']:
+            await self._notify_sync(result)
+        return result
+
+    #   Plan a crawl of every card without knowing their ids, see CardFrontier
+    #   The cards of the previous sync are crawled again and tell how far each character was numbered,
+    #   an index listing of card ids adds the cards released since.
+    #   :param urls: may include index_url, a JSON listing keyed by card id
+    #   :param schools, characters: ids of the lanes probed even if no card of them is known yet
+    #   :param miss_limit: a lane is given up after this many missing numbers in a row
+    #   :return: CardFrontier to pass to crawl
+    async def discover(self, urls: dict, schools, characters, miss_limit: int = 3) -> CardFrontier:
+        async with self.__conn.execute('SELECT id FROM CardInfo') as cursor:
+            known = {card_id for card_id, in await cursor.fetchall()}
+
+        if urls.get('index_url'):
+            try:
+                async with self.__info_throttle:
+                    async with self.__session.get(urls['index_url']) as response:
+                        if response.status == 200:
+                            known.update(int(card_id) for card_id in await response.json(content_type=None))
+            except Exception as e:
+                #   Probing still finds the new cards, only slower
+                pass
+
+        lanes = {(school, character) for school in schools for character in characters}
+        lanes.update(lane_of(card_id)[0] for card_id in known)
+        return CardFrontier(known, lanes, miss_limit)
+
     #   :param: urls:
     #       should include data_url corresponding to json format data
     #       and image_url corresponding to image data
-    #   :param: paths:
-    #       should include active, passive, and image storing file names in str
+    #   :param: files:
+    #       should include the image storing file name in str
     async def grab_card_info(self, card_id: int, urls: dict, files: dict):
         result = {'card': None, 'error': None}
 
@@ -37,14 +345,14 @@ class Scraper(object):
                 #   Separate card data
                 temp = self._split(raw_data['result'])
                 stats = temp['stats']
-                active = temp['active']
-                passive = temp['passive']
 
-                await self._write_card_info(stats)
-                await self._write_card_skill(files['active'], active, files['passive'], passive)
+                status = await self._write_cards([stats], [], [self._skill_row(card_id, temp)])
+                if status['status'] != DBSCode.SUCCESS:
+                    raise status['error_message']
 
                 image_content = await self._fetch_card_art(urls['image_url'])
-                await self._write_card_art(files['image'], image_content)
+                if image_content['image'] is not None:
+                    await self._write_card_art(files['image'], image_content['image'])
 
                 result['card'] = (card_id, stats[1])
         except Exception as e:
@@ -52,92 +360,154 @@ class Scraper(object):
         finally:
             return result
 
-    #   Requests from url
     @staticmethod
-    async def _fetch_card_info(url):
-        async with aiohttp.ClientSession() as session:
-            response = await session.get(url)
-            status = response.status
-            await asyncio.sleep(0.1)
-
-            if status != 200:
-                return {'result': {}}
-            else:
-                result = await response.json()
-                return {'result': result}
+    def _skill_row(card_id: int, card: dict) -> tuple:
+        return card_id, pack(card['active']), pack(card['passive'])
+
+    #   Requests from url
+    #   :param etag, last_modified: validators of the stored version, the server answers 304 if it is current
+    async def _fetch_card_info(self, url, etag: str = None, last_modified: str = None):
+        async with self.__info_throttle:
+            async with self.__session.get(url, headers=self._conditional_headers(etag, last_modified)) as response:
+                result = {
+                    'result': {},
+                    'status': response.status,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'hash': None
+                }
+                if response.status == 200:
+                    content = await response.read()
+                    result['result'] = json.loads(content)
+                    result['hash'] = hashlib.sha256(content).hexdigest()
+                return result
 
     #   Write to Card sqlite
-    #   :param database: the database file to be connected
     #   :param record: list of inserted values, assumed to be following the insertion order
     async def _write_card_info(self, record: list):
+        return await self._write_cards([record], [])
+
+    #   Upsert CardInfo records, CardManifest rows and CardSkill rows in one transaction,
+    #   nothing is written if any fails
+    #   Cards with a manifest row are finished, so they are also marked done in the CrawlCheckpoint
+    #   :param records: lists of values following the insertion order
+    #   :param manifest_rows: dicts with the CardManifest columns
+    #   :param skills: (card_id, active, passive) rows, see _skill_row
+    async def _write_cards(self, records: list, manifest_rows: list, skills: list = ()):
         try:
-            await self.__conn.execute('''
-            INSERT INTO CardInfo (
-            id, 
-            name, 
-            release, 
-            char_id, 
-            school_id, 
-            rarity, 
-            class, 
-            attack_type, 
-            role, 
-            position, 
-            total, 
-            speed, 
-            attack, 
-            health, 
-            magic_def, 
-            physical_def, 
-            critical_chance, 
-            critical_damage) 
-            VALUES ({})
-            '''.format(', '.join(['?'] * len(record))), record)
+            if records:
+                await self.__conn.executemany(CARD_INFO_UPSERT, records)
+            if skills:
+                await self.__conn.executemany(CARD_SKILL_UPSERT, skills)
+            if manifest_rows:
+                synced_at = int(time.time())
+                await self.__conn.executemany(CARD_MANIFEST_UPSERT, [(
+                    row['card_id'],
+                    row.get('etag'),
+                    row.get('last_modified'),
+                    row.get('content_hash'),
+                    row.get('art_etag'),
+                    row.get('art_last_modified'),
+                    row.get('art_hash'),
+                    synced_at
+                ) for row in manifest_rows])
+                await self.__conn.executemany(
+                    "UPDATE CrawlCheckpoint SET status = 'done', updated_at = ? WHERE card_id = ?",
+                    [(synced_at, row['card_id']) for row in manifest_rows]
+                )
 
             await self.__conn.commit()
 
             return {'status': DBSCode.SUCCESS, 'error_message': None}
         except aiosqlite.Error as e:
-            pass
+            await self.__conn.rollback()
             return {'status': DBSCode.INSERTION_ERROR, 'error_message': e}
 
-    #   Write to Card Skill directory
-    #   Generate two corresponding JSON files
-    #   Use pathlib.Path to access certain path.
-    #   :param active_file_name: file for storing active skills
-    #   :param active_skill: dict storing active skills
-    #   :param passive_file_name: file for storing passive skills
-    #   :param passive_skill: dict storing passive skills
-    @staticmethod
-    async def _write_card_skill(
-            active_file_name: str, active_skill: dict,
-            passive_file_name: str, passive_skill: dict
-    ):
-        async with aiofiles.open(active_file_name, 'w') as f:
-            await f.write(json.dumps(active_skill))
-
-        async with aiofiles.open(passive_file_name, 'w') as f:
-            await f.write(json.dumps(passive_skill))
-
-        return {'Status': DBSCode.SUCCESS}
-
-    #   Get card Art image
-    @staticmethod
-    async def _fetch_card_art(url: str):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
+    #   Move skills written as JSON files per card, before skills were stored in CardSkill, into the database
+    #   :param active_directory, passive_directory: directories holding one file per card named by card_id
+    #   :return: number of imported cards
+    async def import_skill_files(self, active_directory: str, passive_directory: str) -> int:
+        skills = []
+        for active_file in Path(active_directory).iterdir():
+            passive_file = Path(passive_directory).joinpath(active_file.name)
+            if not active_file.name.isdigit() or not passive_file.exists():
+                continue
+
+            async with aiofiles.open(active_file, 'r') as f:
+                active_skill = json.loads(await f.read())
+            async with aiofiles.open(passive_file, 'r') as f:
+                passive_skill = json.loads(await f.read())
+            skills.append((int(active_file.name), pack(active_skill), pack(passive_skill)))
+
+        status = await self._write_cards([], [], skills)
+        if status['status'] != DBSCode.SUCCESS:
+            raise status['error_message']
+
+        await self._notify_sync({'cards': [(card_id, None) for card_id, _, _ in skills]})
+        return len(skills)
+
+    #   Record the outcome of the cards a crawl did not write, written cards are already marked done
+    async def _write_checkpoint(self, result: dict):
+        now = int(time.time())
+        await self.__conn.executemany(
+            "UPDATE CrawlCheckpoint SET status = 'done', updated_at = ? WHERE card_id = ?",
+            [(now, card_id) for card_id in result['unchanged']]
+        )
+        await self.__conn.executemany(
+            "UPDATE CrawlCheckpoint SET status = 'missing', updated_at = ? WHERE card_id = ?",
+            [(now, card_id) for card_id in result['missing']]
+        )
+        await self.__conn.executemany(
+            "UPDATE CrawlCheckpoint SET status = 'failed', attempts = attempts + 1, last_error = ?, updated_at = ? "
+            "WHERE card_id = ?",
+            [(error, now, card_id) for card_id, error in result['errors'].items() if isinstance(card_id, int)]
+        )
+        await self.__conn.commit()
+
+    async def _notify_sync(self, result: dict):
+        for listener in self.__sync_listeners:
+            try:
+                await listener(result)
+            except Exception as e:
+                result.setdefault('errors', {})[listener.__qualname__] = traceback.format_exc()
+
+    #   Get card Art image, same validators as _fetch_card_info
+    async def _fetch_card_art(self, url: str, etag: str = None, last_modified: str = None):
+        async with self.__art_throttle:
+            async with self.__session.get(url, headers=self._conditional_headers(etag, last_modified)) as response:
+                result = {
+                    'image': None,
+                    'status': response.status,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'hash': None
+                }
                 if response.status == 200:
-                    image_content = await response.read()
-                    return {'image': image_content}
-                else:
-                    return {'image': None}
+                    result['image'] = await response.read()
+                    result['hash'] = hashlib.sha256(result['image']).hexdigest()
+                return result
 
-    #   Store card Art image to the given directory with id as name
+    @staticmethod
+    def _conditional_headers(etag: str = None, last_modified: str = None) -> dict:
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    #   Read the whole CardManifest, keyed by card_id
+    async def _read_manifest(self) -> dict:
+        async with self.__conn.execute('SELECT * FROM CardManifest') as cursor:
+            columns = [column[0] for column in cursor.description]
+            return {row[0]: dict(zip(columns, row)) async for row in cursor}
+
+    #   Store card Art image to the given directory with id as name, see ArtStore
     @staticmethod
     async def _write_card_art(art_file_name: str, image):
-        async with aiofiles.open(art_file_name, 'wb') as f:
-            await f.write(image)
-            return DBSCode.SUCCESS
+        art_file = Path(art_file_name)
+        await ArtStore(art_file.parent).put(art_file.name, image)
+        return DBSCode.SUCCESS
 
     #   Separate and format original JSON file for storing
     @staticmethod
@@ -149,7 +519,7 @@ class Scraper(object):
         result_sqlite.append(card_id)
 
         #   1
-        name = str(dress['basicInfo']['name']['ja']).encode('utf8')
+        name = str(dress['basicInfo']['name']['ja'])
         result_sqlite.append(name)
 
         #   2
@@ -177,7 +547,7 @@ class Scraper(object):
         result_sqlite.append(attack_type)
 
         #   8
-        role = str(dress['base']['roleIndex']['role']).encode('utf8')
+        role = str(dress['base']['roleIndex']['role'])
         result_sqlite.append(role)
 
         #   9
@@ -0,0 +1,121 @@
+import unicodedata
+
+
+#   Fold the ways members type a card name into one form:
+#   full/half width, case, spaces, and hiragana written for katakana
+def normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKC', str(text)).lower()
+    folded = []
+    for char in text:
+        if char.isspace():
+            continue
+        if 'ぁ' <= char <= 'ゖ':
+            char = chr(ord(char) + 0x60)
+        folded.append(char)
+    return ''.join(folded)
+
+
+#   Card names are short Japanese strings, so they are indexed by character bigrams
+def _grams(text: str) -> set:
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+#   In-memory index resolving user input to card ids by exact name, nickname, or bigram similarity
+class CardNameIndex(object):
+
+    def __init__(self):
+        self._name_of = {}
+        self._exact = {}
+        self._nicknames = {}
+        self._grams_of = {}
+        self._postings = {}
+
+    def __len__(self):
+        return len(self._name_of)
+
+    #   :param cards: (card_id, name) pairs
+    #   :param nicknames: (nickname, card_id) pairs
+    def build(self, cards, nicknames):
+        self._name_of.clear()
+        self._exact.clear()
+        self._nicknames.clear()
+        self._grams_of.clear()
+        self._postings.clear()
+
+        for card_id, name in cards:
+            self._name_of[card_id] = name
+
+            key = normalize(name)
+            self._exact.setdefault(key, card_id)
+            grams = _grams(key)
+            self._grams_of[card_id] = grams
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(card_id)
+
+        for nickname, card_id in nicknames:
+            self.put_nickname(nickname, card_id)
+
+    def put_nickname(self, nickname: str, card_id: int):
+        self._nicknames[normalize(nickname)] = card_id
+
+    def remove_nickname(self, nickname: str):
+        self._nicknames.pop(normalize(nickname), None)
+
+    def has_id(self, card_id: int) -> bool:
+        return card_id in self._name_of
+
+    def name_of(self, card_id: int):
+        return self._name_of.get(card_id)
+
+    #   Card id of an exact name or nickname, None otherwise
+    def exact(self, text: str):
+        key = normalize(text)
+        card_id = self._exact.get(key)
+        return card_id if card_id is not None else self._nicknames.get(key)
+
+    #   Resolve user input to a card id
+    #   :return: {'card_id': id or None, 'candidates': [{'card_id', 'name', 'score'}]}
+    #       card_id is set when the input identifies one card, otherwise candidates holds the top k matches
+    def search(self, text: str, k: int = 5) -> dict:
+        card_id = self.exact(text)
+        if card_id is not None:
+            return {'card_id': card_id, 'candidates': [self._candidate(card_id, 1.0)]}
+
+        key = normalize(text)
+        grams = _grams(key)
+        if not grams:
+            return {'card_id': None, 'candidates': []}
+
+        shared = {}
+        if len(key) < 2:
+            #   A single character is matched against every bigram containing it
+            for gram, candidate_ids in self._postings.items():
+                if key in gram:
+                    for candidate_id in candidate_ids:
+                        shared[candidate_id] = 1
+        else:
+            for gram in grams:
+                for candidate_id in self._postings.get(gram, ()):
+                    shared[candidate_id] = shared.get(candidate_id, 0) + 1
+
+        #   Rank by the share of the input found in the name, then by overall similarity
+        scored = []
+        for candidate_id, count in shared.items():
+            coverage = count / len(grams)
+            if coverage < 0.5:
+                continue
+            dice = 2 * count / (len(grams) + len(self._grams_of[candidate_id]))
+            scored.append((coverage, dice, candidate_id))
+        scored.sort(key=lambda item: (-item[0], -item[1], item[2]))
+
+        candidates = [self._candidate(candidate_id, round(dice, 3)) for _, dice, candidate_id in scored[:k]]
+        complete = [item for item in scored if item[0] == 1.0]
+        if len(complete) == 1:
+            #   Only one card contains every part of the input, a partial match is only suggested
+            card_id = complete[0][2]
+        return {'card_id': card_id, 'candidates': candidates}
+
+    def _candidate(self, card_id: int, score: float) -> dict:
+        return {'card_id': card_id, 'name': self._name_of.get(card_id), 'score': score}
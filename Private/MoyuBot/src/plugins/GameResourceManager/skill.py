@@ -0,0 +1,11 @@
+import json
+import zlib
+
+
+#   Skills are kept as zlib compressed compact JSON, one blob for the active and one for the passive skills
+def pack(skill: dict) -> bytes:
+    return zlib.compress(json.dumps(skill, ensure_ascii=False, separators=(',', ':')).encode('utf8'))
+
+
+def unpack(blob: bytes) -> dict:
+    return json.loads(zlib.decompress(blob).decode('utf8'))
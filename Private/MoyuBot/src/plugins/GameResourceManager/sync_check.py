@@ -0,0 +1,250 @@
+#   Check the conditional card sync against a local stub of the card site
+#   Run as a script from anywhere, no network is needed, e.g.
+#       python sync_check.py --cards 20
+#   The stub answers with ETags and honours If-None-Match, the crawls in order expect:
+#       first sync: every card is 200 and written with its art
+#       unchanged site: every card is 304, nothing is written and no art is requested
+#       changed cards: 200 with a new hash, written again, their unchanged art is answered with 304
+#       new ETags over the same content: 200 with a known hash, only the manifest is refreshed
+#       changed art: written again with the new art
+#       art published after the card: the card is written without art and fetched in full on every sync
+#           until its art exists, then answered with 304 again
+#   Exits with status 1 if any expectation fails.
+import argparse
+import asyncio
+import hashlib
+import json
+import sqlite3
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+from aiohttp import web
+
+if __package__ in (None, ''):
+    #   Load the plugin modules without running the plugin __init__, which needs a nonebot driver
+    _package = types.ModuleType('GameResourceManager')
+    _package.__path__ = [str(Path(__file__).resolve().parent)]
+    sys.modules['GameResourceManager'] = _package
+    __package__ = 'GameResourceManager'
+
+from .scraper import Scraper
+
+
+#   Dress JSON shaped like karth.top, version changes the content
+def _dress(card_id: int, version: int) -> dict:
+    return {
+        'basicInfo': {
+            'cardID': card_id, 'name': {'ja': 'カード{}-{}'.format(card_id, version)},
+            'released': {'ja': 1600000000}, 'character': 101, 'rarity': 4
+        },
+        'base': {'attribute': 1, 'attackType': 1, 'roleIndex': {'role': 'front', 'index': 1}},
+        'stat': {'total': 1, 'agi': 2, 'atk': 3, 'hp': 4, 'mdef': 5, 'pdef': 6},
+        'other': {'dex': 7, 'cri': 8},
+        'act': {'act1': {'version': version}, 'act2': {}, 'act3': {}},
+        'groupSkills': {'climaxACT': {}, 'unitSkill': {}, 'finishACT': {}},
+        'skills': {}
+    }
+
+
+#   Card site serving dress JSON and art, both with ETags
+#   The ETag of a card is its content hash salted with the generation, rotate changes every ETag
+#   without changing any content, as a redeploy of the site does.
+class StubSite(object):
+
+    def __init__(self, card_ids):
+        self.versions = {card_id: 0 for card_id in card_ids}
+        self.art_versions = {card_id: 0 for card_id in card_ids}
+        self.generation = 0
+        self.requests = {}
+
+    def rotate(self):
+        self.generation += 1
+
+    def reset_counts(self):
+        self.requests = {}
+
+    def _answer(self, request, kind: str, body: bytes, content_type: str):
+        etag = '"{}-{}"'.format(self.generation, hashlib.sha256(body).hexdigest()[:16])
+        if request.headers.get('If-None-Match') == etag:
+            status = 304
+        else:
+            status = 200
+        self.requests[(kind, status)] = self.requests.get((kind, status), 0) + 1
+
+        if status == 304:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=body, content_type=content_type, headers={'ETag': etag})
+
+    async def data(self, request):
+        card_id = int(request.match_info['card_id'])
+        if card_id not in self.versions:
+            self.requests[('data', 404)] = self.requests.get(('data', 404), 0) + 1
+            return web.Response(status=404)
+        body = json.dumps(_dress(card_id, self.versions[card_id])).encode()
+        return self._answer(request, 'data', body, 'application/json')
+
+    async def art(self, request):
+        card_id = int(request.match_info['card_id'])
+        if card_id not in self.art_versions:
+            return web.Response(status=404)
+        body = 'art of {} version {}'.format(card_id, self.art_versions[card_id]).encode()
+        return self._answer(request, 'art', body, 'image/png')
+
+    async def start(self) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_get('/dress/{card_id}.json', self.data)
+        app.router.add_get('/art/{card_id}.png', self.art)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        return runner
+
+
+class Checks(object):
+
+    def __init__(self):
+        self.failures = []
+        self.results = []
+
+    def expect(self, step: str, name: str, actual, expected):
+        passed = actual == expected
+        self.results.append({'step': step, 'check': name, 'actual': actual, 'expected': expected, 'passed': passed})
+        if not passed:
+            self.failures.append('{}: {} is {}, expected {}'.format(step, name, actual, expected))
+
+
+def _manifest(db_path: Path) -> dict:
+    with sqlite3.connect(str(db_path)) as conn:
+        return {row[0]: row[1:] for row in conn.execute('SELECT card_id, etag, content_hash, art_hash FROM CardManifest')}
+
+
+def _names(db_path: Path) -> dict:
+    with sqlite3.connect(str(db_path)) as conn:
+        return dict(conn.execute('SELECT id, name FROM CardInfo'))
+
+
+async def check_sync(args) -> dict:
+    card_ids = [1010001 + number for number in range(args.cards)]
+    site = StubSite(card_ids)
+    runner = await site.start()
+    port = runner.addresses[0][1]
+    urls = {
+        'data_url': 'http://127.0.0.1:{}/dress/{{}}.json'.format(port),
+        'image_url': 'http://127.0.0.1:{}/art/{{}}.png'.format(port)
+    }
+
+    synced = []
+
+    async def on_sync(result: dict):
+        synced.append(len(result['cards']))
+
+    checks = Checks()
+    with tempfile.TemporaryDirectory() as directory:
+        root = Path(directory)
+        db_path = root.joinpath('Card.db')
+        paths = {'image': root.joinpath('Art')}
+        scraper = Scraper(str(db_path), concurrency=4, rate=0)
+        Scraper.add_sync_listener(on_sync)
+        await scraper.open()
+        try:
+            step = 'first sync'
+            result = await scraper.crawl(card_ids, urls, paths, incremental=True)
+            checks.expect(step, 'written cards', len(result['cards']), len(card_ids))
+            checks.expect(step, 'data 200', site.requests.get(('data', 200), 0), len(card_ids))
+            checks.expect(step, 'art 200', site.requests.get(('art', 200), 0), len(card_ids))
+            checks.expect(step, 'stored art', len([p for p in paths['image'].iterdir() if p.is_file()]), len(card_ids))
+            checks.expect(step, 'errors', result['errors'], {})
+            manifest = _manifest(db_path)
+
+            step = 'unchanged site'
+            site.reset_counts()
+            synced.clear()
+            result = await scraper.crawl(card_ids, urls, paths, incremental=True)
+            checks.expect(step, 'data 304', site.requests.get(('data', 304), 0), len(card_ids))
+            checks.expect(step, 'art requests', site.requests.get(('art', 200), 0) + site.requests.get(('art', 304), 0), 0)
+            checks.expect(step, 'unchanged cards', len(result['unchanged']), len(card_ids))
+            checks.expect(step, 'written cards', len(result['cards']), 0)
+            checks.expect(step, 'sync listener calls', synced, [])
+            checks.expect(step, 'manifest', _manifest(db_path), manifest)
+
+            step = 'changed cards'
+            changed = card_ids[::4]
+            for card_id in changed:
+                site.versions[card_id] += 1
+            site.reset_counts()
+            synced.clear()
+            result = await scraper.crawl(card_ids, urls, paths, incremental=True)
+            names = _names(db_path)
+            checks.expect(step, 'written cards', sorted(card_id for card_id, _ in result['cards']), changed)
+            checks.expect(step, 'data 304', site.requests.get(('data', 304), 0), len(card_ids) - len(changed))
+            checks.expect(step, 'art 304', site.requests.get(('art', 304), 0), len(changed))
+            checks.expect(step, 'new names', sum(names[card_id].endswith('-1') for card_id in changed), len(changed))
+            checks.expect(step, 'sync listener calls', synced, [len(changed)])
+
+            manifest = _manifest(db_path)
+
+            step = 'new ETags over the same content'
+            site.rotate()
+            site.reset_counts()
+            result = await scraper.crawl(card_ids, urls, paths, incremental=True)
+            refreshed = _manifest(db_path)
+            checks.expect(step, 'data 200', site.requests.get(('data', 200), 0), len(card_ids))
+            checks.expect(step, 'art requests', site.requests.get(('art', 200), 0) + site.requests.get(('art', 304), 0), 0)
+            checks.expect(step, 'unchanged cards', len(result['unchanged']), len(card_ids))
+            checks.expect(step, 'written cards', len(result['cards']), 0)
+            checks.expect(step, 'refreshed ETags', sum(
+                refreshed[card_id][0] != manifest[card_id][0] for card_id in card_ids
+            ), len(card_ids))
+            checks.expect(step, 'content hashes', {k: v[1] for k, v in refreshed.items()}, {k: v[1] for k, v in manifest.items()})
+
+            step = 'changed art'
+            for card_id in changed[:2]:
+                site.versions[card_id] += 1
+                site.art_versions[card_id] += 1
+            site.reset_counts()
+            result = await scraper.crawl(card_ids, urls, paths, incremental=True)
+            checks.expect(step, 'art 200', site.requests.get(('art', 200), 0), len(changed[:2]))
+            checks.expect(step, 'stored art', [
+                paths['image'].joinpath(str(card_id)).read_bytes().endswith(b'version 1') for card_id in changed[:2]
+            ], [True] * len(changed[:2]))
+
+            step = 'art published after the card'
+            late = card_ids[-1] + 1
+            site.versions[late] = 0
+            card_ids.append(late)
+            site.reset_counts()
+            result = await scraper.crawl(card_ids, urls, paths, incremental=True)
+            checks.expect(step, 'written cards', [card_id for card_id, _ in result['cards']], [late])
+            checks.expect(step, 'missing art', result['missing_art'], [late])
+            result = await scraper.crawl(card_ids, urls, paths, incremental=True)
+            checks.expect(step, 'card fetched again', [card_id for card_id, _ in result['cards']], [late])
+            site.art_versions[late] = 0
+            site.reset_counts()
+            result = await scraper.crawl(card_ids, urls, paths, incremental=True)
+            checks.expect(step, 'art 200 once published', site.requests.get(('art', 200), 0), 1)
+            checks.expect(step, 'missing art once published', result['missing_art'], [])
+            checks.expect(step, 'stored art', paths['image'].joinpath(str(late)).exists(), True)
+            site.reset_counts()
+            result = await scraper.crawl(card_ids, urls, paths, incremental=True)
+            checks.expect(step, 'data 304 afterwards', site.requests.get(('data', 304), 0), len(card_ids))
+        finally:
+            await scraper.close()
+            await runner.cleanup()
+
+    return {'passed': not checks.failures, 'failures': checks.failures, 'checks': checks.results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Conditional card sync against a local stub site')
+    parser.add_argument('--cards', type=int, default=20)
+    args = parser.parse_args()
+
+    report = asyncio.run(check_sync(args))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    sys.exit(0 if report['passed'] else 1)
+
+
+if __name__ == '__main__':
+    main()
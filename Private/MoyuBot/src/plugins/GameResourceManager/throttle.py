@@ -0,0 +1,42 @@
+import asyncio
+
+
+#   Space out requests to at most rate per second, shared by every worker of a crawl stage
+#   A rate of 0 or less disables the limit
+class RateLimiter(object):
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self._interval:
+            return
+
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = self._next
+            self._next = now + self._interval
+
+
+#   Bound both the number of requests in flight and the request rate of one host
+class Throttle(object):
+
+    def __init__(self, concurrency: int, rate: float):
+        self._semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+        self._limiter = RateLimiter(rate)
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        try:
+            await self._limiter.wait()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
@@ -1,69 +1,157 @@
-from sqlalchemy import delete, update, or_
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import delete, update, func
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.future import select
-from sqlalchemy.orm import sessionmaker
 
-from sqlalchemy.engine import Engine
-from sqlalchemy import event
-
-from .model import Boss
+from .model import Boss, Record
 from .constants import DBStatusCode
 from .debugger import debugger
+from .engine import EngineRegistry
+from .cache import boss_aliases, boss_list
 
 
-@event.listens_for(Engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.close()
-
-
-#   Use singleton to force single connection.
+#   Use singleton to share the engine registry.
+#   Also tracks the total damage dealt to every boss, so progress is answered without the database
 class BossController(object):
     __instance = None
+    __health = {}
+    __damage = {}
 
     def __new__(cls, db_path: str):
         if cls.__instance is None:
             cls.__instance = object.__new__(cls)
-            cls.__engine = create_async_engine('sqlite+aiosqlite:///' + db_path)
-            cls.__session = sessionmaker(cls.__engine, expire_on_commit=False, class_=AsyncSession)
+            cls.__registry = EngineRegistry(db_path)
         return cls.__instance
 
     def __init__(self, db_path: str):
         pass
 
+    #   Fill the alias index from the BossInfo, must be done before any other method is used
+    async def load_aliases(self):
+        async with self.__registry.session.begin() as async_session:
+            query = await async_session.stream(select(Boss.boss_id, Boss.alias))
+            boss_aliases.load(await query.all())
+        boss_list.bump()
+
+    #   Seed the damage totals with one aggregate query over the RevueRecord
+    #   Must be done before any record is added, RecordController keeps the totals up to date afterwards
+    async def load_progress(self):
+        cls = type(self)
+        stmt = select(
+            Boss.boss_id, Boss.health, func.coalesce(func.sum(Record.damage), 0)
+        ).outerjoin(
+            Record, Record.boss_id == Boss.boss_id
+        ).group_by(Boss.boss_id)
+
+        async with self.__registry.session.begin() as async_session:
+            query = await async_session.stream(stmt)
+            rows = await query.all()
+
+        cls.__health = {boss_id: health for boss_id, health, _ in rows}
+        cls.__damage = {boss_id: damage for boss_id, _, damage in rows}
+
+    #   Called by RecordController once records of a boss are committed, damage is negative for deletion
     @classmethod
-    def change_database(cls, db_path: str):
-        cls.__engine = create_async_engine('sqlite+aiosqlite:///' + str(db_path))
-        cls.__session = sessionmaker(cls.__engine, expire_on_commit=False, class_=AsyncSession)
+    def record_damage(cls, boss_id: int, damage: int):
+        if boss_id in cls.__damage:
+            cls.__damage[boss_id] += damage
+
+    #   Remaining health and kill status of one boss_id/alias, or of every boss if identifier is None
+    @debugger
+    async def progress(self, identifier: str = None):
+        cls = type(self)
+        if identifier is None:
+            boss_ids = sorted(cls.__health)
+        else:
+            try:
+                boss_id = boss_aliases.resolve(record_id=int(identifier))
+            except ValueError:
+                boss_id = boss_aliases.resolve(alias=str(identifier))
+            boss_ids = [boss_id] if boss_id in cls.__health else []
+
+        result = []
+        for boss_id in boss_ids:
+            health = cls.__health[boss_id]
+            damage = cls.__damage[boss_id]
+            result.append({
+                'boss_id': boss_id,
+                'alias': boss_aliases.alias_of(boss_id),
+                'health': health,
+                'damage': damage,
+                'remaining': max(health - damage, 0),
+                'killed': damage >= health
+            })
+        return {'result': result, 'code': DBStatusCode.SEARCH_SUCCESS}
 
     #   Add a new boss record to the BossInfo
     #   The key-value pairs in dict must match the parameter of Boss
     #   i.e. boss_id, alias, health
     @debugger
     async def add(self, info: dict):
-        existence = await self._search_single(info['boss_id'], info['alias'])
-        if existence:
+        if boss_aliases.has_alias(info['alias']):
             return {'result': None, 'code': DBStatusCode.RECORD_ALREADY_EXIST}
 
-        async with self.__session.begin() as async_session:
-            async_session.add(Boss(**info))
+        async with self.__registry.session.begin() as async_session:
+            stmt = insert(Boss).values(**info).on_conflict_do_nothing(index_elements=[Boss.boss_id])
+            result = await async_session.execute(stmt)
+
+        if result.rowcount == 0:
+            return {'result': None, 'code': DBStatusCode.RECORD_ALREADY_EXIST}
+        boss_aliases.put(int(info['boss_id']), info['alias'])
+        self._track(int(info['boss_id']), int(info['health']))
+        boss_list.bump()
 
         #   Nothing is returned for adding
         return{'result': None, 'code': DBStatusCode.INSERT_SUCCESS}
 
+    #   Add a list of boss records to the BossInfo in one transaction
+    #   Every dict must match the parameter of Boss, i.e. boss_id, alias, health
+    #   Rows whose boss_id or alias is already taken, or repeated in the list, are skipped and reported
+    #   as {'boss_id', 'alias', 'reason'}, all other rows are inserted together or not at all
+    @debugger
+    async def add_many(self, infos: list):
+        rows, conflicts = [], []
+        seen_ids, seen_aliases = set(), set()
+
+        for info in infos:
+            row = {'boss_id': int(info['boss_id']), 'alias': str(info['alias']), 'health': int(info['health'])}
+
+            if boss_aliases.has_id(row['boss_id']) or row['boss_id'] in seen_ids:
+                conflicts.append({'boss_id': row['boss_id'], 'alias': row['alias'], 'reason': 'boss_id'})
+            elif boss_aliases.has_alias(row['alias']) or row['alias'] in seen_aliases:
+                conflicts.append({'boss_id': row['boss_id'], 'alias': row['alias'], 'reason': 'alias'})
+            else:
+                rows.append(row)
+                seen_ids.add(row['boss_id'])
+                seen_aliases.add(row['alias'])
+
+        if rows:
+            async with self.__registry.session.begin() as async_session:
+                await async_session.execute(insert(Boss), rows)
+
+            for row in rows:
+                boss_aliases.put(row['boss_id'], row['alias'])
+                self._track(row['boss_id'], row['health'])
+            boss_list.bump()
+
+        return {
+            'result': {'inserted': [row['boss_id'] for row in rows], 'conflicts': conflicts},
+            'code': DBStatusCode.INSERT_SUCCESS if rows else DBStatusCode.RECORD_ALREADY_EXIST
+        }
+
     #   Delete a boss record from the BossInfo
     #   Must only delete by boss_id
     @debugger
     async def delete(self, boss_id: int):
-        existence = await self._search_single(boss_id, str(boss_id))
-        if not existence:
-            return {'result': None, 'code': DBStatusCode.RECORD_NOT_EXIST}
-
-        async with self.__session.begin() as async_session:
+        async with self.__registry.session.begin() as async_session:
             stmt = delete(Boss).where(Boss.boss_id == boss_id)
-            await async_session.execute(stmt)
+            result = await async_session.execute(stmt)
+
+        boss_aliases.remove(int(boss_id))
+        self.__health.pop(int(boss_id), None)
+        self.__damage.pop(int(boss_id), None)
+        if result.rowcount == 0:
+            return {'result': None, 'code': DBStatusCode.RECORD_NOT_EXIST}
+        boss_list.bump()
 
         #   Nothing is returned for removing
         return {'result': None, 'code': DBStatusCode.DELETE_SUCCESS}
@@ -73,27 +161,22 @@ class BossController(object):
     #   i.e. boss_id, alias, health
     @debugger
     async def update(self, info: dict):
-        existence = await self._search_single(info['boss_id'], info['alias'])
-        if not existence:
-            return {'result': None, 'code': DBStatusCode.RECORD_NOT_EXIST}
-
-        async with self.__session.begin() as async_session:
+        async with self.__registry.session.begin() as async_session:
             stmt = update(Boss).where(Boss.boss_id == info['boss_id']).values(**info)
-            await async_session.execute(stmt)
+            result = await async_session.execute(stmt)
+
+        if result.rowcount == 0:
+            return {'result': None, 'code': DBStatusCode.RECORD_NOT_EXIST}
+        boss_aliases.put(int(info['boss_id']), info['alias'])
+        self._track(int(info['boss_id']), int(info['health']))
+        boss_list.bump()
 
         return {'result': None, 'code': DBStatusCode.UPDATE_SUCCESS}
 
     #   Search a single member record in the CompanyInfo
     @debugger
     async def search(self, identifier: str):
-        try:
-            boss_id = int(identifier)
-            alias = ''
-        except ValueError:
-            boss_id = -1
-            alias = identifier
-
-        record = await self._search_single(boss_id, alias)
+        record = await self._search_single(identifier)
         if not record:
             return {'result': {}, 'code': DBStatusCode.SEARCH_SUCCESS}
         else:
@@ -106,7 +189,7 @@ class BossController(object):
     #   List all member records in the CompanyInfo
     @debugger
     async def list(self):
-        async with self.__session.begin() as async_session:
+        async with self.__registry.session.begin() as async_session:
             query = await async_session.stream(select(Boss))
             records = await query.scalars().all()
 
@@ -119,11 +202,22 @@ class BossController(object):
                 })
         return {'result': result, 'code': DBStatusCode.SEARCH_SUCCESS}
 
-    #   Helper method for check boss existence
-    async def _search_single(self, boss_id: int, alias: str) -> Boss:
-        async with self.__session.begin() as async_session:
-            results = await async_session.stream(
-                select(Boss).filter(or_(Boss.boss_id == boss_id, Boss.alias == alias))
-            )
-            result = await results.scalars().first()
+    #   Helper method for registering the health of a boss, the damage dealt so far is kept
+    @classmethod
+    def _track(cls, boss_id: int, health: int):
+        cls.__health[boss_id] = health
+        cls.__damage.setdefault(boss_id, 0)
+
+    #   Helper method for retrieving a boss by boss_id/alias
+    #   Unknown identifiers are answered by the alias index without querying the database
+    async def _search_single(self, identifier) -> Boss:
+        try:
+            boss_id = boss_aliases.resolve(record_id=int(identifier))
+        except ValueError:
+            boss_id = boss_aliases.resolve(alias=str(identifier))
+        if boss_id is None:
+            return None
+
+        async with self.__registry.session.begin() as async_session:
+            result = await async_session.get(Boss, boss_id)
         return result
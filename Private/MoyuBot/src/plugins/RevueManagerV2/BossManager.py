@@ -1,5 +1,3 @@
-import asyncio
-
 import nonebot
 import nonebot.typing as typing
 import nonebot.permission as permission
@@ -11,6 +9,7 @@ from nonebot.plugin import on_command
 from .config import Config
 from .constants import InteractionMessage
 from . import data_source
+from .cache import boss_list
 
 global_config = nonebot.get_driver().config
 plugin_config = Config(**global_config.dict())
@@ -54,6 +53,12 @@ list_boss = on_command(
     priority=4
 )
 
+boss_progress = on_command(
+    cmd='boss_progress',
+    aliases={'boss进度', 'bp'},
+    priority=4
+)
+
 add_boss_range = on_command(
     cmd='add_boss_range',
     aliases={'添加boss组', 'abr'},
@@ -335,6 +340,12 @@ async def search_boss_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: typin
 
 @list_boss.handle()
 async def list_boss_retriever(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    #   Rendered reply is kept until a boss is added, changed or deleted
+    generation = boss_list.generation
+    output_message = boss_list.get('list')
+    if output_message is not None:
+        await search_boss.finish(output_message)
+
     boss_list_result = await data_source.bc.list()
 
     if boss_list_result['error'] is not None:
@@ -351,12 +362,42 @@ async def list_boss_retriever(bot: cqhttp.Bot, event: cqhttp.Event, state: typin
     else:
         if not boss_list_result['response']['result']:
             #   No boss stored
-            await search_boss.finish(InteractionMessage.RECORD_LIST_EMPTY)
+            output_message = InteractionMessage.RECORD_LIST_EMPTY
         else:
-            await search_boss.finish(
+            output_message = InteractionMessage.RECORD_LIST_SUCCESS + '\n\t' + \
+                             '\n\t'.join(map(_info_format, boss_list_result['response']['result']))
+        boss_list.put('list', output_message, generation)
+        await search_boss.finish(output_message)
+
+
+#   Answered from the damage totals kept by BossController, the database is not queried
+@boss_progress.handle()
+async def boss_progress_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    raw_arg = str(event.get_message()).strip()
+    progress_result = await data_source.bc.progress(raw_arg if raw_arg else None)
+
+    if progress_result['error'] is not None:
+        if bot.config.debug:
+            await bot.send_private_msg(
+                user_id=plugin_config.AUTHOR,
+                message=progress_result['func_info']
+            )
+            await bot.send_private_msg(
+                user_id=plugin_config.AUTHOR,
+                message=progress_result['error']
+            )
+        await boss_progress.finish(InteractionMessage.ERROR_MESSAGE)
+    else:
+        if not progress_result['response']['result']:
+            if raw_arg:
+                await boss_progress.finish(InteractionMessage.RECORD_FIND_FAIL.format(raw_arg))
+            else:
+                await boss_progress.finish(InteractionMessage.RECORD_LIST_EMPTY)
+        else:
+            await boss_progress.finish(
                 InteractionMessage.RECORD_LIST_SUCCESS
                 + '\n\t'
-                + '\n\t'.join(map(_info_format, boss_list_result['response']['result']))
+                + '\n\t'.join(map(_progress_format, progress_result['response']['result']))
             )
 
 
@@ -367,31 +408,64 @@ async def add_boss_range_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: ty
     raw_args = str(event.get_message()).strip()
     arg_list = list(map(str.strip, raw_args.split(plugin_config.separator)))
 
-    boss_names = arg_list[0:4]
-    boss_healths = list(map(int, arg_list[4:8]))
-    start_level = int(arg_list[8])
-    end_level = int(arg_list[9])
+    if len(arg_list) != 10:
+        await add_boss_range.finish(InteractionMessage.INVALID_ARG_NUMBER)
 
-    adding_tasks = []
+    try:
+        boss_names = arg_list[0:4]
+        boss_healths = list(map(int, arg_list[4:8]))
+        start_level = int(arg_list[8])
+        end_level = int(arg_list[9])
+    except ValueError:
+        await add_boss_range.finish(InteractionMessage.INVALID_ARG)
 
+    infos = []
     for level in range(start_level, end_level):
         for i in range(len(boss_names)):
-            info = {
+            infos.append({
                 'boss_id': level * 100 + i + 1,
                 'alias': 'R' + str(level) + boss_names[i],
                 'health': boss_healths[i]
-            }
-            adding_tasks.append(asyncio.create_task(data_source.bc.add(info)))
+            })
 
-    await asyncio.wait(adding_tasks)
+    add_result = await data_source.bc.add_many(infos)
+    if add_result['error'] is not None:
+        if bot.config.debug:
+            await bot.send_private_msg(
+                user_id=plugin_config.AUTHOR,
+                message=add_result['func_info']
+            )
+            await bot.send_private_msg(
+                user_id=plugin_config.AUTHOR,
+                message=add_result['error']
+            )
+        await add_boss_range.finish('\n'.join([
+            InteractionMessage.RECORD_CHANGE_FAIL,
+            InteractionMessage.ERROR_MESSAGE
+        ]))
 
-    await add_boss_range.finish(
-        message='Added Boss in level range {} and {}'.format(start_level, end_level)
-    )
+    result = add_result['response']['result']
+    message = 'Added {} Boss in level range {} and {}'.format(len(result['inserted']), start_level, end_level)
+    if result['conflicts']:
+        message = message + '\n' + InteractionMessage.RECORD_ALREADT_EXIST + '\n\t' + '\n\t'.join(map(
+            lambda conflict: 'BossID: {}; Boss名: {}'.format(conflict['boss_id'], conflict['alias']),
+            result['conflicts']
+        ))
+    await add_boss_range.finish(message=message)
 
 
 #   :param: raw_info should be {'boss_id': id, 'alias': alias, 'health': health}
 def _info_format(raw_info):
     return 'BossID: {}; '.format(str(raw_info['boss_id'])) + \
            'Boss名: {}; '.format(raw_info['alias']) + \
-           '血量: {}; '.format(str(raw_info['health']))
\ No newline at end of file
+           '血量: {}; '.format(str(raw_info['health']))
+
+
+#   :param: progress should be an entry of BossController.progress
+def _progress_format(progress):
+    message = InteractionMessage.BOSS_PROGRESS.format(
+        progress['alias'], progress['boss_id'], progress['remaining'], progress['health']
+    )
+    if progress['killed']:
+        message = message + ' ' + InteractionMessage.BOSS_KILLED
+    return message
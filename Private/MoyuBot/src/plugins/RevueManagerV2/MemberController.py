@@ -1,54 +1,51 @@
-from sqlalchemy import delete, update, or_
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.future import select
-from sqlalchemy.orm import sessionmaker
-
-from sqlalchemy.engine import Engine
-from sqlalchemy import event
 
 from .model import Member
 from .constants import DBStatusCode
 from .debugger import debugger
+from .engine import EngineRegistry
+from .cache import member_aliases, member_list
 
 
-@event.listens_for(Engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.close()
-
-
-#   Use singleton to force single connection.
+#   Use singleton to share the engine registry.
 class MemberController(object):
     __instance = None
 
     def __new__(cls, db_path: str):
         if cls.__instance is None:
             cls.__instance = object.__new__(cls)
-            cls.__engine = create_async_engine('sqlite+aiosqlite:///' + db_path)
-            cls.__session = sessionmaker(cls.__engine, expire_on_commit=False, class_=AsyncSession)
+            cls.__registry = EngineRegistry(db_path)
         return cls.__instance
 
     def __init__(self, db_path: str):
         pass
 
-    @classmethod
-    def change_database(cls, db_path: str):
-        cls.__engine = create_async_engine('sqlite+aiosqlite:///' + str(db_path))
-        cls.__session = sessionmaker(cls.__engine, expire_on_commit=False, class_=AsyncSession)
+    #   Fill the alias index from the CompanyInfo, must be done before any other method is used
+    async def load_aliases(self):
+        async with self.__registry.session.begin() as async_session:
+            query = await async_session.stream(select(Member.member_id, Member.alias))
+            member_aliases.load(await query.all())
+        member_list.bump()
 
     #   Add a new member record to the CompanyInfo
     #   The key-value pairs in dict must match the parameter of Member
     #   i.e. member_id, alias, account, password
+    #   A taken member_id is detected by the insert itself, a taken alias by the alias index
     @debugger
     async def add(self, info: dict):
-        existence = await self._search_single(info['member_id'], info['alias'])
-        if existence:
+        if member_aliases.has_alias(info['alias']):
             return {'result': None, 'code': DBStatusCode.RECORD_ALREADY_EXIST}
 
-        async with self.__session.begin() as async_session:
-            async_session.add(Member(**info))
+        async with self.__registry.session.begin() as async_session:
+            stmt = insert(Member).values(**info).on_conflict_do_nothing(index_elements=[Member.member_id])
+            result = await async_session.execute(stmt)
+
+        if result.rowcount == 0:
+            return {'result': None, 'code': DBStatusCode.RECORD_ALREADY_EXIST}
+        member_aliases.put(str(info['member_id']), info['alias'])
+        member_list.bump()
 
         #   Nothing is returned for adding
         return {'result': None, 'code': DBStatusCode.INSERT_SUCCESS}
@@ -57,13 +54,18 @@ class MemberController(object):
     #   Must only delete by member_id
     @debugger
     async def delete(self, member_id: str):
-        existence = await self._search_single(member_id, member_id)
-        if not existence:
+        member_id = member_aliases.resolve(str(member_id), str(member_id))
+        if member_id is None:
             return {'result': None, 'code': DBStatusCode.RECORD_NOT_EXIST}
 
-        async with self.__session.begin() as async_session:
+        async with self.__registry.session.begin() as async_session:
             stmt = delete(Member).where(Member.member_id == member_id)
-            await async_session.execute(stmt)
+            result = await async_session.execute(stmt)
+
+        member_aliases.remove(member_id)
+        if result.rowcount == 0:
+            return {'result': None, 'code': DBStatusCode.RECORD_NOT_EXIST}
+        member_list.bump()
 
         #   Nothing is returned for removing
         return {'result': None, 'code': DBStatusCode.DELETE_SUCCESS}
@@ -73,20 +75,21 @@ class MemberController(object):
     #   i.e. member_id, alias, account, password
     @debugger
     async def update(self, info: dict):
-        existence = await self._search_single(info['member_id'], info['alias'])
-        if not existence:
-            return {'result': None, 'code': DBStatusCode.RECORD_NOT_EXIST}
-
-        async with self.__session.begin() as async_session:
+        async with self.__registry.session.begin() as async_session:
             stmt = update(Member).where(Member.member_id == info['member_id']).values(**info)
-            await async_session.execute(stmt)
+            result = await async_session.execute(stmt)
+
+        if result.rowcount == 0:
+            return {'result': None, 'code': DBStatusCode.RECORD_NOT_EXIST}
+        member_aliases.put(str(info['member_id']), info['alias'])
+        member_list.bump()
 
         return {'result': None, 'code': DBStatusCode.UPDATE_SUCCESS}
 
     #   Search a single member record in the CompanyInfo
     @debugger
     async def search(self, identifier: str):
-        record = await self._search_single(identifier, identifier)
+        record = await self._search_single(str(identifier))
         if not record:
             return {'result': {}, 'code': DBStatusCode.SEARCH_SUCCESS}
         else:
@@ -100,7 +103,7 @@ class MemberController(object):
     #   List all member records in the CompanyInfo
     @debugger
     async def list(self):
-        async with self.__session.begin() as async_session:
+        async with self.__registry.session.begin() as async_session:
             query = await async_session.stream(select(Member))
             records = await query.scalars().all()
 
@@ -114,11 +117,13 @@ class MemberController(object):
                 })
         return {'result': result, 'code': DBStatusCode.SEARCH_SUCCESS}
 
-    #   Helper method for check member existence
-    async def _search_single(self, member_id: str, alias: str) -> Member:
-        async with self.__session.begin() as async_session:
-            results = await async_session.stream(
-                select(Member).filter(or_(Member.member_id == member_id, Member.alias == alias))
-            )
-            result = await results.scalars().first()
+    #   Helper method for retrieving a member by member_id/alias
+    #   Unknown identifiers are answered by the alias index without querying the database
+    async def _search_single(self, identifier: str) -> Member:
+        member_id = member_aliases.resolve(identifier, identifier)
+        if member_id is None:
+            return None
+
+        async with self.__registry.session.begin() as async_session:
+            result = await async_session.get(Member, member_id)
         return result
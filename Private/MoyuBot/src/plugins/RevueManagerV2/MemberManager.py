@@ -8,6 +8,7 @@ from nonebot.plugin import on_command
 from .config import Config
 from .constants import InteractionMessage
 from . import data_source
+from .cache import member_list
 
 global_config = nonebot.get_driver().config
 plugin_config = Config(**global_config.dict())
@@ -361,55 +362,63 @@ async def search_member_group_handler(bot: cqhttp.Bot, event: cqhttp.GroupMessag
         )
 
 
+#   Rendered replies are kept until a member is added, changed or deleted
 @list_member.handle()
 async def list_member_retriever(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
-    member_list_result = await data_source.mc.list()
+    generation = member_list.generation
+    messages = member_list.get('list')
+    if messages is None:
+        member_list_result = await data_source.mc.list()
 
-    if member_list_result['error'] is not None:
-        if bot.config.debug:
-            await bot.send_private_msg(
-                user_id=plugin_config.AUTHOR,
-                message=member_list_result['func_info']
-            )
-            await bot.send_private_msg(
-                user_id=plugin_config.AUTHOR,
-                message=member_list_result['error']
-            )
-        await search_member.finish(InteractionMessage.ERROR_MESSAGE)
-    else:
-        if not member_list_result['response']['result']:
-            #   No member stored
-            await search_member.finish(InteractionMessage.RECORD_LIST_EMPTY)
+        if member_list_result['error'] is not None:
+            if bot.config.debug:
+                await bot.send_private_msg(
+                    user_id=plugin_config.AUTHOR,
+                    message=member_list_result['func_info']
+                )
+                await bot.send_private_msg(
+                    user_id=plugin_config.AUTHOR,
+                    message=member_list_result['error']
+                )
+            await search_member.finish(InteractionMessage.ERROR_MESSAGE)
+
+        member_info = member_list_result['response']['result']
+        if not member_info:
+            #   No member stored, cached as well so an empty company is not queried again
+            messages = {'admin': None, 'public': None}
         else:
-            state['member_list'] = member_list_result['response']['result']
+            messages = {
+                #   Full information for Company Administrator
+                'admin': InteractionMessage.RECORD_LIST_SUCCESS + '\n\t' +
+                         '\n\t'.join(map(_admin_info_format, member_info)),
+                #   Only non-private information for ordinary member
+                'public': InteractionMessage.RECORD_LIST_SUCCESS + '\n\t' +
+                          '\n\t'.join(map(_non_admin_info_format, member_info))
+            }
+        member_list.put('list', messages, generation)
+
+    if messages['public'] is None:
+        await search_member.finish(InteractionMessage.RECORD_LIST_EMPTY)
+    state['member_messages'] = messages
 
 
 @list_member.handle()
 async def list_member_private_handler(bot: cqhttp.Bot, event: cqhttp.PrivateMessageEvent, state: typing.T_State):
     if event.user_id in plugin_config.ADMIN:
         #   Output full information for Company Administrator
-        output_message = InteractionMessage.RECORD_LIST_SUCCESS + '\n\t' + \
-                         '\n\t'.join(map(_admin_info_format, state['member_list']))
-
-        await search_member.finish(message=output_message)
+        await search_member.finish(message=state['member_messages']['admin'])
     else:
         #   Output only non-private information for ordinary member
-        output_message = InteractionMessage.RECORD_LIST_SUCCESS + '\n\t' + \
-                         '\n\t'.join(map(_non_admin_info_format, state['member_list']))
-
-        await search_member.finish(message=output_message)
+        await search_member.finish(message=state['member_messages']['public'])
 
 
 @list_member.handle()
 async def list_member_group_handler(bot: cqhttp.Bot, event: cqhttp.GroupMessageEvent, state: typing.T_State):
     if event.sender.role in ['owner', 'admin'] or event.user_id in plugin_config.ADMIN:
         #   Output full information for Company Administrator through private message
-        output_message = InteractionMessage.RECORD_LIST_SUCCESS + '\n\t' + \
-                         '\n\t'.join(map(_admin_info_format, state['member_list']))
-
         await bot.send_private_msg(
             user_id=event.user_id,
-            message=output_message
+            message=state['member_messages']['admin']
         )
         await search_member.finish(
             message=InteractionMessage.PRIVATE_MESSAGE_SENT_CHECK,
@@ -417,10 +426,7 @@ async def list_member_group_handler(bot: cqhttp.Bot, event: cqhttp.GroupMessageE
         )
     else:
         #   Output only non-private information for ordinary member
-        output_message = InteractionMessage.RECORD_LIST_SUCCESS + '\n\t' + \
-                         '\n\t'.join(map(_non_admin_info_format, state['member_list']))
-
-        await search_member.finish(message=output_message)
+        await search_member.finish(message=state['member_messages']['public'])
 
 
 #   :param: raw_info should be {'id': id, 'alias': alias, 'account': account, 'password': password}
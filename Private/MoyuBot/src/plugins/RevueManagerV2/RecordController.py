@@ -1,71 +1,74 @@
-from sqlalchemy import delete, or_, and_
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy.future import select
-from sqlalchemy.orm import sessionmaker, selectinload, with_loader_criteria
+import time
 
-from sqlalchemy.engine import Engine
-from sqlalchemy import event
+from sqlalchemy import delete, insert, or_, and_, func, cast, Integer
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload, with_loader_criteria
 
-from .model import Member, Boss, Record
+from .model import Member, Boss, Record, DailyDamageRollup
 from .constants import DBStatusCode
 from .debugger import debugger
+from .engine import EngineRegistry
+from .batcher import WriteBehindBatcher
+from .cache import member_aliases, boss_aliases
+from .BossController import BossController
 
 
-@event.listens_for(Engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.close()
-
-
-#   Use singleton to force single connection.
+#   Use singleton to share the engine registry.
 class RecordController(object):
     __instance = None
 
-    def __new__(cls, db_path: str):
+    def __new__(cls, db_path: str, batch_size: int = 64, batch_delay: float = 0.05):
         if cls.__instance is None:
             cls.__instance = object.__new__(cls)
-            cls.__engine = create_async_engine('sqlite+aiosqlite:///' + db_path)
-            cls.__session = sessionmaker(cls.__engine, expire_on_commit=False, class_=AsyncSession)
+            cls.__registry = EngineRegistry(db_path)
+            cls.__batcher = WriteBehindBatcher(cls.__instance._write_batch, batch_size, batch_delay)
         return cls.__instance
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, batch_size: int = 64, batch_delay: float = 0.05):
         pass
 
-    @classmethod
-    def change_database(cls, db_path: str):
-        cls.__engine = create_async_engine('sqlite+aiosqlite:///' + str(db_path))
-        cls.__session = sessionmaker(cls.__engine, expire_on_commit=False, class_=AsyncSession)
-
     #   Add a new revue record to the RevueRecord
     #   The key-value pairs in dict must match the parameter of Record
     #   i.e. member_id, boss_id, damage, sequence, turn, team, date_time
+    #   Records are queued and committed together with other records added in the same short window
     @debugger
     async def add(self, info: dict):
-        async with self.__session.begin() as async_session:
-            async_session.add(Record(**info))
+        await self.__batcher.submit(info)
 
         #   Nothing is returned for adding
         return {'result': None, 'code': DBStatusCode.INSERT_SUCCESS}
 
+    #   Commit all queued records now
+    async def flush(self):
+        await self.__batcher.drain()
+
     #   Delete a revue record from the RevueRecord
     #   Deletion is performed based on member_id/alias, boss_id/alias, and damage
     @debugger
     async def delete(self, member_identifier: str, boss_identifier: str, damage: int):
-        member_id = await self._member_id_locator(member_identifier)
-        boss_id = await self._boss_id_locator(boss_identifier)
+        await self.__batcher.drain()
+
+        member_id = self._member_id_locator(member_identifier)
+        boss_id = self._boss_id_locator(boss_identifier)
 
         if member_id == '' or boss_id == -1:
             return {'result': None, 'code': DBStatusCode.RECORD_NOT_EXIST}
 
-        async with self.__session.begin() as async_session:
-            stmt = delete(Record).where(and_(
-                Record.member_id == member_id,
-                Record.boss_id == boss_id,
-                Record.damage == damage
-            ))
-            await async_session.execute(stmt)
+        condition = and_(
+            Record.member_id == member_id,
+            Record.boss_id == boss_id,
+            Record.damage == damage
+        )
+        async with self.__registry.session.begin() as async_session:
+            query = await async_session.stream(select(Record.date_time).filter(condition))
+            game_days = {self.game_day(date_time) for date_time in await query.scalars().all()}
+
+            result = await async_session.execute(delete(Record).where(condition))
+            await self._rebuild_rollup(async_session, member_id, boss_id, game_days)
+
+        BossController.record_damage(boss_id, -int(damage) * result.rowcount)
 
         #   Nothing is returned for removing
         return {'result': None, 'code': DBStatusCode.DELETE_SUCCESS}
@@ -73,7 +76,9 @@ class RecordController(object):
     #   Search revue records from the RevueRecord identified by member_id/alias, time_range(from, to)
     @debugger
     async def search_by_member(self, member_identifier: str, time_range: tuple[int, int]):
-        async with self.__session.begin() as async_session:
+        await self.__batcher.drain()
+
+        async with self.__registry.session.begin() as async_session:
             stmt = select(Member).options(
                 selectinload(Member.records),
                 with_loader_criteria(Record, and_(
@@ -105,7 +110,9 @@ class RecordController(object):
             boss_id = -1
             boss_alias = boss_identifier
 
-        async with self.__session.begin() as async_session:
+        await self.__batcher.drain()
+
+        async with self.__registry.session.begin() as async_session:
             stmt = select(Boss).options(
                 selectinload(Boss.records),
                 with_loader_criteria(Record, and_(
@@ -127,33 +134,342 @@ class RecordController(object):
         else:
             return {'result': [], 'code': DBStatusCode.SEARCH_FAIL}
 
-    #   Helper method for retrieving member_id
-    async def _member_id_locator(self, member_identifier: str) -> str:
-        async with self.__session.begin() as async_session:
-            query = await async_session.stream(
-                select(Member).filter(or_(Member.member_id == member_identifier, Member.alias == member_identifier))
-            )
-            record = await query.scalars().first()
-        if record is None:
+    #   Page through revue records of a member, ordered by boss_id
+    #   :param time_range: (from, to), an empty tuple for all records
+    #   :param cursor: the cursor returned with the previous page, None for the first page
+    #   :param offset: number of rows skipped before the first page, used to jump to a given page
+    #   The returned cursor is None when there is no further page
+    @debugger
+    async def page_by_member(self, member_identifier: str, time_range: tuple, cursor: tuple = None,
+                             page_size: int = 10, offset: int = 0):
+        member_id = self._member_id_locator(member_identifier)
+        if member_id == '':
+            return {'result': [], 'cursor': None, 'code': DBStatusCode.SEARCH_FAIL}
+
+        stmt = select(*self._columns()).filter(Record.member_id == member_id)
+        if cursor is not None:
+            stmt = stmt.filter(or_(
+                Record.boss_id > cursor[0],
+                and_(Record.boss_id == cursor[0], Record.record_id > cursor[1])
+            ))
+        stmt = stmt.order_by(Record.boss_id.asc(), Record.record_id.asc())
+
+        rows = await self._page(self._time_filter(stmt, time_range), page_size, offset)
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = (rows[-1]['boss_id'], rows[-1]['record_id'])
+
+        return {'result': rows, 'cursor': next_cursor, 'code': DBStatusCode.SEARCH_SUCCESS}
+
+    #   Page through revue records of a boss, ordered by damage from high to low
+    #   Parameters and result are the same as page_by_member
+    @debugger
+    async def page_by_boss(self, boss_identifier: str, time_range: tuple, cursor: tuple = None,
+                           page_size: int = 10, offset: int = 0):
+        boss_id = self._boss_id_locator(boss_identifier)
+        if boss_id == -1:
+            return {'result': [], 'cursor': None, 'code': DBStatusCode.SEARCH_FAIL}
+
+        stmt = select(*self._columns()).filter(Record.boss_id == boss_id)
+        if cursor is not None:
+            stmt = stmt.filter(or_(
+                Record.damage < cursor[0],
+                and_(Record.damage == cursor[0], Record.record_id > cursor[1])
+            ))
+        stmt = stmt.order_by(Record.damage.desc(), Record.record_id.asc())
+
+        rows = await self._page(self._time_filter(stmt, time_range), page_size, offset)
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = (rows[-1]['damage'], rows[-1]['record_id'])
+
+        return {'result': rows, 'cursor': next_cursor, 'code': DBStatusCode.SEARCH_SUCCESS}
+
+    #   Sum the daily damage rollup per member, ordered by total damage
+    #   :param day_range: (from, to) game days in YYYYMMDD form, an empty tuple for the whole season
+    #   :param boss_identifier: restrict to one boss_id/alias, None for all bosses
+    @debugger
+    async def statistics(self, day_range: tuple, boss_identifier: str = None):
+        await self.__batcher.drain()
+
+        stmt = select(
+            DailyDamageRollup.member_id,
+            Member.alias,
+            func.sum(DailyDamageRollup.total_damage).label('total_damage'),
+            func.sum(DailyDamageRollup.hit_count).label('hit_count'),
+            func.max(DailyDamageRollup.max_hit).label('max_hit'),
+            func.sum(DailyDamageRollup.turns_used).label('turns_used')
+        ).join(
+            Member, Member.member_id == DailyDamageRollup.member_id
+        ).group_by(
+            DailyDamageRollup.member_id
+        ).order_by(
+            func.sum(DailyDamageRollup.total_damage).desc()
+        )
+
+        if day_range:
+            stmt = stmt.filter(DailyDamageRollup.game_day.between(day_range[0], day_range[1]))
+        if boss_identifier is not None:
+            boss_id = self._boss_id_locator(boss_identifier)
+            if boss_id == -1:
+                return {'result': [], 'code': DBStatusCode.SEARCH_FAIL}
+            stmt = stmt.filter(DailyDamageRollup.boss_id == boss_id)
+
+        async with self.__registry.session.begin() as async_session:
+            query = await async_session.stream(stmt)
+            result = [dict(row) for row in await query.mappings().all()]
+
+        return {'result': result, 'code': DBStatusCode.SEARCH_SUCCESS}
+
+    #   Rank members by their total damage in one aggregate query over the RevueRecord
+    #   :param time_range: (from, to), an empty tuple for the whole season
+    #   :param boss_identifier: restrict to one boss_id/alias, None for all bosses
+    #   :param limit: number of members returned, members sharing a total share the rank
+    @debugger
+    async def leaderboard(self, time_range: tuple, boss_identifier: str = None, limit: int = 10):
+        await self.__batcher.drain()
+
+        total_damage = func.sum(Record.damage)
+        stmt = select(
+            Record.member_id,
+            total_damage.label('total_damage'),
+            func.count().label('hit_count'),
+            func.rank().over(order_by=total_damage.desc()).label('rank')
+        ).group_by(Record.member_id)
+
+        stmt = self._time_filter(stmt, time_range)
+        if boss_identifier is not None:
+            boss_id = self._boss_id_locator(boss_identifier)
+            if boss_id == -1:
+                return {'result': [], 'code': DBStatusCode.SEARCH_FAIL}
+            stmt = stmt.filter(Record.boss_id == boss_id)
+
+        totals = stmt.subquery()
+        stmt = select(
+            totals.c.rank,
+            totals.c.member_id,
+            Member.alias,
+            totals.c.total_damage,
+            totals.c.hit_count
+        ).join(
+            Member, Member.member_id == totals.c.member_id
+        ).order_by(
+            totals.c.rank, totals.c.member_id
+        ).limit(limit)
+
+        async with self.__registry.session.begin() as async_session:
+            query = await async_session.stream(stmt)
+            result = [dict(row) for row in await query.mappings().all()]
+
+        return {'result': result, 'code': DBStatusCode.SEARCH_SUCCESS}
+
+    #   Rebuild the whole daily damage rollup from the RevueRecord, used to backfill existing data
+    @debugger
+    async def rebuild_statistics(self):
+        await self.__batcher.drain()
+
+        async with self.__registry.session.begin() as async_session:
+            await async_session.execute(delete(DailyDamageRollup))
+            await async_session.execute(insert(DailyDamageRollup).from_select(
+                self._rollup_columns(), self._rollup_source()
+            ))
+            query = await async_session.execute(select(func.count()).select_from(DailyDamageRollup))
+            count = query.scalar()
+
+        return {'result': count, 'code': DBStatusCode.INSERT_SUCCESS}
+
+    #   Game day of a unix timestamp in YYYYMMDD form, a game day starts at 4:00 local time
+    @staticmethod
+    def game_day(timestamp: int) -> int:
+        return int(time.strftime('%Y%m%d', time.localtime(int(timestamp) - 4 * 3600)))
+
+    #   Helper method for streaming one page, one extra row is fetched to know whether a next page exists
+    async def _page(self, stmt, page_size: int, offset: int) -> list:
+        await self.__batcher.drain()
+
+        rows = []
+        async with self.__registry.session.begin() as async_session:
+            query = await async_session.stream(stmt.limit(page_size + 1).offset(offset))
+            async for row in query.mappings():
+                rows.append(dict(row))
+        return rows
+
+    #   Helper method for restricting a record query to time_range, an empty tuple means no restriction
+    @staticmethod
+    def _time_filter(stmt, time_range: tuple):
+        if not time_range:
+            return stmt
+        return stmt.filter(and_(Record.date_time >= time_range[0], Record.date_time <= time_range[1]))
+
+    @staticmethod
+    def _columns() -> list:
+        return [
+            Record.record_id,
+            Record.member_id,
+            Record.boss_id,
+            Record.damage,
+            Record.sequence,
+            Record.turn,
+            Record.team,
+            Record.date_time
+        ]
+
+    #   Insert a batch of queued records in one transaction
+    #   Rows referring to a member or boss missing from the alias index are rejected individually,
+    #   so one bad record does not fail the others in the same batch
+    #   A member or boss deleted while its record was queued passes the check but fails the foreign key,
+    #   the batch is then inserted row by row so that only those rows fail
+    async def _write_batch(self, infos: list) -> list:
+        results = [None] * len(infos)
+        rows = []
+        for index, info in enumerate(infos):
+            try:
+                rows.append((index, self._normalizer(info)))
+            except (KeyError, TypeError, ValueError) as e:
+                results[index] = e
+
+        if not rows:
+            return results
+
+        valid = []
+        for index, row in rows:
+            if not member_aliases.has_id(row['member_id']):
+                results[index] = LookupError('Member {} does not exist.'.format(row['member_id']))
+            elif not boss_aliases.has_id(row['boss_id']):
+                results[index] = LookupError('Boss {} does not exist.'.format(row['boss_id']))
+            else:
+                valid.append((index, row))
+
+        if not valid:
+            return results
+
+        try:
+            await self._insert_records([row for _, row in valid])
+            inserted = [row for _, row in valid]
+        except IntegrityError:
+            inserted = []
+            for index, row in valid:
+                try:
+                    await self._insert_records([row])
+                    inserted.append(row)
+                except IntegrityError as e:
+                    results[index] = e
+
+        for row in inserted:
+            BossController.record_damage(row['boss_id'], row['damage'])
+
+        return results
+
+    #   Helper method for inserting records and their rollup in one transaction
+    async def _insert_records(self, rows: list):
+        async with self.__registry.session.begin() as async_session:
+            await async_session.execute(insert(Record), rows)
+            await self._add_to_rollup(async_session, rows)
+
+    #   Helper method for adding newly inserted records to the daily damage rollup
+    async def _add_to_rollup(self, async_session, rows: list):
+        totals = {}
+        for row in rows:
+            key = (row['member_id'], row['boss_id'], self.game_day(row['date_time']))
+            total = totals.setdefault(key, {
+                'member_id': key[0], 'boss_id': key[1], 'game_day': key[2],
+                'total_damage': 0, 'hit_count': 0, 'max_hit': 0, 'turns_used': 0
+            })
+            total['total_damage'] += row['damage']
+            total['hit_count'] += 1
+            total['max_hit'] = max(total['max_hit'], row['damage'])
+            total['turns_used'] += row['turn']
+
+        stmt = sqlite_insert(DailyDamageRollup)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DailyDamageRollup.member_id, DailyDamageRollup.boss_id, DailyDamageRollup.game_day],
+            set_={
+                'total_damage': DailyDamageRollup.total_damage + stmt.excluded.total_damage,
+                'hit_count': DailyDamageRollup.hit_count + stmt.excluded.hit_count,
+                'max_hit': func.max(DailyDamageRollup.max_hit, stmt.excluded.max_hit),
+                'turns_used': DailyDamageRollup.turns_used + stmt.excluded.turns_used
+            }
+        )
+        await async_session.execute(stmt, list(totals.values()))
+
+    #   Helper method for recomputing the rollup rows of a member and boss on the given game days
+    #   Used after deletion, since the maximum hit cannot be decremented
+    async def _rebuild_rollup(self, async_session, member_id: str, boss_id: int, game_days: set):
+        if not game_days:
+            return
+
+        await async_session.execute(delete(DailyDamageRollup).where(and_(
+            DailyDamageRollup.member_id == member_id,
+            DailyDamageRollup.boss_id == boss_id,
+            DailyDamageRollup.game_day.in_(game_days)
+        )))
+        await async_session.execute(insert(DailyDamageRollup).from_select(
+            self._rollup_columns(),
+            self._rollup_source().filter(and_(
+                Record.member_id == member_id,
+                Record.boss_id == boss_id,
+                self._game_day_clause().in_(game_days)
+            ))
+        ))
+
+    @staticmethod
+    def _rollup_columns() -> list:
+        return ['member_id', 'boss_id', 'game_day', 'total_damage', 'hit_count', 'max_hit', 'turns_used']
+
+    #   Aggregate of RevueRecord with the same columns as DailyDamageRollup
+    @classmethod
+    def _rollup_source(cls):
+        game_day = cls._game_day_clause()
+        return select(
+            Record.member_id,
+            Record.boss_id,
+            game_day,
+            func.sum(Record.damage),
+            func.count(),
+            func.max(Record.damage),
+            func.sum(Record.turn)
+        ).group_by(Record.member_id, Record.boss_id, game_day)
+
+    #   SQL counterpart of game_day
+    @staticmethod
+    def _game_day_clause():
+        return cast(func.strftime('%Y%m%d', Record.date_time - 4 * 3600, 'unixepoch', 'localtime'), Integer)
+
+    #   Helper method for retrieving member_id, resolved by the alias index
+    @staticmethod
+    def _member_id_locator(member_identifier: str) -> str:
+        member_id = member_aliases.resolve(str(member_identifier), str(member_identifier))
+        if member_id is None:
             return ''
         else:
-            return record.member_id
+            return member_id
 
-    #   Helper method for retrieving boss_id
-    async def _boss_id_locator(self, boss_identifier: str) -> int:
+    #   Helper method for retrieving boss_id, resolved by the alias index
+    @staticmethod
+    def _boss_id_locator(boss_identifier: str) -> int:
         try:
-            boss_id = int(boss_identifier)
-            stmt = select(Boss).filter(Boss.boss_id == boss_id)
+            boss_id = boss_aliases.resolve(record_id=int(boss_identifier))
         except ValueError:
-            stmt = select(Boss).filter(Boss.alias == boss_identifier)
-
-        async with self.__session.begin() as async_session:
-            query = await async_session.stream(stmt)
-            record = await query.scalars().first()
-        if record is None:
+            boss_id = boss_aliases.resolve(alias=str(boss_identifier))
+        if boss_id is None:
             return -1
         else:
-            return record.boss_id
+            return boss_id
+
+    #   Helper method for casting raw record arguments to the column types of Record
+    @staticmethod
+    def _normalizer(info: dict) -> dict:
+        return {
+            'member_id': str(info['member_id']),
+            'boss_id': int(info['boss_id']),
+            'damage': int(info['damage']),
+            'sequence': int(info['sequence']),
+            'turn': int(info['turn']),
+            'team': int(info['team']),
+            'date_time': int(info['date_time'])
+        }
 
     #   Helper formatter method
     @staticmethod
@@ -8,9 +8,10 @@ import nonebot.adapters.cqhttp as cqhttp
 import nonebot.adapters.cqhttp.permission as cpermission
 
 from nonebot.plugin import on_command
+from nonebot.matcher import Matcher
 
 from .config import Config
-from .constants import InteractionMessage, DBStatusCode
+from .constants import InteractionMessage
 from . import data_source
 
 global_config = nonebot.get_driver().config
@@ -53,6 +54,18 @@ search_record_by_boss = on_command(
     priority=3
 )
 
+leaderboard = on_command(
+    cmd='leaderboard',
+    aliases={'排行', 'rk'},
+    priority=3
+)
+
+damage_statistics = on_command(
+    cmd='damage_statistics',
+    aliases={'统计', 'ds'},
+    priority=3
+)
+
 
 @helper.handle()
 async def helper_handler(bot: cqhttp.Bot, event: cqhttp.GroupMessageEvent, state: typing.T_State):
@@ -175,31 +188,78 @@ async def search_record_helper(bot: cqhttp.Bot, event: cqhttp.Event, state: typi
     await search_record.finish(InteractionMessage.RECORD_SEARCH_HELP_MESSAGE)
 
 
+#   Arguments should be member_id/alias, {date(YYYY-MM-DD)|-all}, {page N}
+#   Records are shown page by page, the cursor of the next page is kept in the state
 @search_record_by_member.handle()
-async def search_by_member_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+async def search_by_member_first_receive(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    await _search_first_page(bot, event, state, search_record_by_member, data_source.rc.page_by_member)
+
+
+@search_record_by_member.handle()
+async def search_by_member_next_page(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State, matcher: Matcher):
+    await _search_next_page(bot, event, state, matcher, data_source.rc.page_by_member)
+
+
+#   Arguments should be boss_id/alias, {date(YYYY-MM-DD)|-all}, {page N}
+@search_record_by_boss.handle()
+async def search_by_boss_first_receive(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    await _search_first_page(bot, event, state, search_record_by_boss, data_source.rc.page_by_boss)
+
+
+@search_record_by_boss.handle()
+async def search_by_boss_next_page(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State, matcher: Matcher):
+    await _search_next_page(bot, event, state, matcher, data_source.rc.page_by_boss)
+
+
+async def _search_first_page(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State, matcher, searcher):
     raw_args = str(event.get_message()).strip()
     arg_list = list(map(str.strip, raw_args.split(plugin_config.separator)))
 
-    if len(arg_list) not in [1, 2]:
+    if len(arg_list) not in [1, 2, 3]:
         #   Not enough arguments have been provided
-        await search_record_by_member.finish(InteractionMessage.INVALID_ARG_NUMBER)
-
-    time_range = ()
-    if len(arg_list) == 1:
-        now_date = datetime.date.today()
-        game_init_timestamp = int(time.mktime(now_date.timetuple())) + 4 * 3600
-        time_range = (game_init_timestamp, game_init_timestamp + 24 * 3600 - 1)
-    else:
-        if arg_list[1] != '-all':
+        await matcher.finish(InteractionMessage.INVALID_ARG_NUMBER)
+
+    state['identifier'] = arg_list[0]
+    state['by_member'] = matcher is search_record_by_member
+    state['time_range'] = _time_range_parser('')
+    state['page'] = 1
+    for arg in arg_list[1:]:
+        if arg.startswith('page'):
             try:
-                time_slice = datetime.datetime.strptime(arg_list[1], '%Y-%m-%d')
-                start_timestamp = int(time.mktime(time_slice.timetuple())) + 4 * 3600
-                time_range = (start_timestamp, start_timestamp + 24 * 3600 - 1)
+                state['page'] = max(1, int(arg[len('page'):].strip()))
             except ValueError:
-                await search_record_by_member.finish(InteractionMessage.INVALID_ARG)
+                await matcher.finish(InteractionMessage.INVALID_ARG)
+        else:
+            time_range = _time_range_parser(arg)
+            if time_range is None:
+                await matcher.finish(InteractionMessage.INVALID_ARG)
+            state['time_range'] = time_range
+
+    search_result = await searcher(
+        state['identifier'], state['time_range'],
+        page_size=plugin_config.record_page_size,
+        offset=(state['page'] - 1) * plugin_config.record_page_size
+    )
+    await _send_page(bot, state, matcher, search_result, matcher.pause)
+
+
+#   :param matcher: the running session, not the command's matcher class
+async def _search_next_page(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State, matcher: Matcher, searcher):
+    if str(event.get_message()).strip() not in InteractionMessage.NEXT_PAGE_MESSAGE:
+        #   Any other reply ends the search and is handled as if no search was waiting, e.g. another command
+        matcher.block = False
+        await matcher.finish()
+
+    state['page'] = state['page'] + 1
+    search_result = await searcher(
+        state['identifier'], state['time_range'], state['cursor'],
+        page_size=plugin_config.record_page_size
+    )
+    await _send_page(bot, state, matcher, search_result, matcher.reject)
 
-    search_result = await data_source.rc.search_by_member(arg_list[0], time_range)
 
+#   Send one page of records, then wait for a next page request through wait_next if there is one
+async def _send_page(bot: cqhttp.Bot, state: typing.T_State, matcher, search_result: dict, wait_next):
     if search_result['error'] is not None:
         if bot.config.debug:
             await bot.send_private_msg(
@@ -210,67 +270,134 @@ async def search_by_member_handler(bot: cqhttp.Bot, event: cqhttp.Event, state:
                 user_id=plugin_config.AUTHOR,
                 message=search_result['error']
             )
-        await search_record_by_member.finish(InteractionMessage.ERROR_MESSAGE)
+        await matcher.finish(InteractionMessage.ERROR_MESSAGE)
+
+    records = search_result['response']['result']
+    if not records:
+        #   No record found
+        await matcher.finish(
+            message=InteractionMessage.RECORD_FIND_FAIL.format(state['identifier'])
+        )
+
+    if state['by_member']:
+        subject, formatter = '成员(' + state['identifier'] + ')', _revue_record_member_formatter
     else:
-        if not search_result['response']['result']:
-            #   No record found
-            await search_record_by_member.finish(
-                message=InteractionMessage.RECORD_FIND_FAIL.format(arg_list[0])
-            )
-        else:
-            result_message = InteractionMessage.RECORD_FIND_SUCCESS.format('成员(' + arg_list[0] + ')')
-            result_message = result_message + '\n'.join(map(
-                _revue_record_member_formatter,
-                search_result['response']['result']
-            ))
-            await search_record_by_member.finish(result_message)
+        subject, formatter = 'Boss(' + state['identifier'] + ')', _revue_record_boss_formatter
 
+    result_message = InteractionMessage.RECORD_FIND_SUCCESS.format(subject) + \
+        InteractionMessage.RECORD_PAGE.format(state['page']) + \
+        '\n'.join(map(formatter, records))
 
-@search_record_by_boss.handle()
-async def search_by_boss_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    state['cursor'] = search_result['response']['cursor']
+    if state['cursor'] is None:
+        await matcher.finish(result_message)
+    else:
+        await wait_next(prompt=result_message + '\n' + InteractionMessage.REQUEST_NEXT_PAGE)
+
+
+#   Convert a date argument to the (from, to) timestamps of that game day
+#   An empty argument means today, -all means no restriction, None is returned for invalid input
+#   A game day starts at 4:00 local time, today is the game day of RecordController.game_day as for /统计
+def _time_range_parser(arg: str):
+    if arg == '-all':
+        return ()
+
+    if arg == '':
+        start_date = datetime.datetime.strptime(str(data_source.rc.game_day(int(time.time()))), '%Y%m%d')
+    else:
+        try:
+            start_date = datetime.datetime.strptime(arg, '%Y-%m-%d')
+        except ValueError:
+            return None
+
+    start_timestamp = int(time.mktime(start_date.timetuple())) + 4 * 3600
+    return start_timestamp, start_timestamp + 24 * 3600 - 1
+
+
+#   Arguments should be {date(YYYY-MM-DD)|-all}, {boss_id/alias}, both optional
+#   Without a date the statistics of the current game day are shown
+@damage_statistics.handle()
+async def damage_statistics_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
     raw_args = str(event.get_message()).strip()
-    arg_list = list(map(str.strip, raw_args.split(plugin_config.separator)))
+    arg_list = list(map(str.strip, raw_args.split(plugin_config.separator))) if raw_args else []
 
-    if len(arg_list) not in [1, 2]:
-        #   Not enough arguments have been provided
-        await search_record_by_boss.finish(InteractionMessage.INVALID_ARG_NUMBER)
+    if len(arg_list) > 2:
+        await damage_statistics.finish(InteractionMessage.INVALID_ARG_NUMBER)
 
-    time_range = ()
-    if len(arg_list) == 1:
-        now_date = datetime.date.today()
-        game_init_timestamp = int(time.mktime(now_date.timetuple())) + 4 * 3600
-        time_range = (game_init_timestamp, game_init_timestamp + 24 * 3600 - 1)
+    if not arg_list or arg_list[0] == '':
+        today = data_source.rc.game_day(int(time.time()))
+        day_range = (today, today)
+    elif arg_list[0] == '-all':
+        day_range = ()
     else:
-        if arg_list[1] != '-all':
-            try:
-                time_slice = datetime.datetime.strptime(arg_list[1], '%Y-%m-%d')
-                start_timestamp = int(time.mktime(time_slice.timetuple())) + 4 * 3600
-                time_range = (start_timestamp, start_timestamp + 24 * 3600 - 1)
-            except ValueError:
-                await search_record_by_boss.finish(InteractionMessage.INVALID_ARG)
+        try:
+            day = int(datetime.datetime.strptime(arg_list[0], '%Y-%m-%d').strftime('%Y%m%d'))
+            day_range = (day, day)
+        except ValueError:
+            await damage_statistics.finish(InteractionMessage.INVALID_ARG)
 
-    search_result = await data_source.rc.search_by_boss(arg_list[0], time_range)
+    boss_identifier = arg_list[1] if len(arg_list) == 2 else None
+    statistics_result = await data_source.rc.statistics(day_range, boss_identifier)
 
-    if search_result['status'] != DBStatusCode.SEARCH_SUCCESS:
+    if statistics_result['error'] is not None:
         if bot.config.debug:
             await bot.send_private_msg(
                 user_id=plugin_config.AUTHOR,
-                message=str(search_result['error'])
+                message=statistics_result['func_info']
             )
-        await search_record_by_boss.finish(InteractionMessage.ERROR_MESSAGE)
-    else:
-        if not search_result['result']:
-            #   No record found
-            await search_record_by_boss.finish(
-                message=InteractionMessage.RECORD_FIND_FAIL.format(arg_list[0])
+            await bot.send_private_msg(
+                user_id=plugin_config.AUTHOR,
+                message=statistics_result['error']
             )
-        else:
-            result_message = InteractionMessage.RECORD_FIND_SUCCESS.format('Boss(' + arg_list[0] + ')')
-            result_message = result_message + '\n'.join(map(
-                _revue_record_boss_formatter,
-                search_result['response']['result']
-            ))
-            await search_record_by_boss.finish(result_message)
+        await damage_statistics.finish(InteractionMessage.ERROR_MESSAGE)
+
+    if not statistics_result['response']['result']:
+        await damage_statistics.finish(InteractionMessage.RECORD_LIST_EMPTY)
+
+    await damage_statistics.finish(
+        InteractionMessage.RECORD_LIST_SUCCESS + '\n' +
+        '\n'.join(map(_statistics_formatter, statistics_result['response']['result']))
+    )
+
+
+#   Arguments should be {date(YYYY-MM-DD)|-all}, {boss_id/alias}, both optional
+#   Without a date the ranking of the current game day is shown, -all ranks the whole season
+@leaderboard.handle()
+async def leaderboard_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    raw_args = str(event.get_message()).strip()
+    arg_list = list(map(str.strip, raw_args.split(plugin_config.separator))) if raw_args else []
+
+    if len(arg_list) > 2:
+        await leaderboard.finish(InteractionMessage.INVALID_ARG_NUMBER)
+
+    time_range = _time_range_parser(arg_list[0] if arg_list else '')
+    if time_range is None:
+        await leaderboard.finish(InteractionMessage.INVALID_ARG)
+
+    boss_identifier = arg_list[1] if len(arg_list) == 2 else None
+    leaderboard_result = await data_source.rc.leaderboard(
+        time_range, boss_identifier, plugin_config.leaderboard_size
+    )
+
+    if leaderboard_result['error'] is not None:
+        if bot.config.debug:
+            await bot.send_private_msg(
+                user_id=plugin_config.AUTHOR,
+                message=leaderboard_result['func_info']
+            )
+            await bot.send_private_msg(
+                user_id=plugin_config.AUTHOR,
+                message=leaderboard_result['error']
+            )
+        await leaderboard.finish(InteractionMessage.ERROR_MESSAGE)
+
+    if not leaderboard_result['response']['result']:
+        await leaderboard.finish(InteractionMessage.RECORD_LIST_EMPTY)
+
+    await leaderboard.finish(
+        InteractionMessage.RECORD_LIST_SUCCESS + '\n' +
+        '\n'.join(map(_leaderboard_formatter, leaderboard_result['response']['result']))
+    )
 
 
 #   Check and return what each arg is
@@ -320,3 +447,26 @@ def _revue_record_boss_formatter(record: dict) -> str:
     )
 
     return result
+
+
+#   Format the damage statistics of a single member
+def _statistics_formatter(statistics: dict) -> str:
+    return '\t成员 {}({}) 总伤害 {}，出刀 {} 次，最高 {}，消耗 {} 回合'.format(
+        statistics['alias'],
+        statistics['member_id'],
+        statistics['total_damage'],
+        statistics['hit_count'],
+        statistics['max_hit'],
+        statistics['turns_used']
+    )
+
+
+#   Format a single leaderboard entry
+def _leaderboard_formatter(entry: dict) -> str:
+    return '\t第 {} 名 成员 {}({}) 总伤害 {}，出刀 {} 次'.format(
+        entry['rank'],
+        entry['alias'],
+        entry['member_id'],
+        entry['total_damage'],
+        entry['hit_count']
+    )
@@ -1,54 +1,47 @@
-from sqlalchemy import delete, update, or_, and_
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import delete, insert, update, or_, and_, exists, literal
 from sqlalchemy.future import select
-from sqlalchemy.orm import sessionmaker, selectinload
-
-from sqlalchemy.engine import Engine
-from sqlalchemy import event
+from sqlalchemy.orm import selectinload
 
 from .model import Member, Team
 from .constants import DBStatusCode
 from .debugger import debugger
+from .engine import EngineRegistry
+from .cache import member_aliases
 
 
-@event.listens_for(Engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.close()
-
-
-#   Use singleton to force single connection
+#   Use singleton to share the engine registry.
 class TeamController(object):
     __instance = None
 
     def __new__(cls, db_path: str):
         if cls.__instance is None:
             cls.__instance = object.__new__(cls)
-            cls.__engine = create_async_engine('sqlite+aiosqlite:///' + db_path)
-            cls.__session = sessionmaker(cls.__engine, expire_on_commit=False, class_=AsyncSession)
+            cls.__registry = EngineRegistry(db_path)
         return cls.__instance
 
-    def __int__(self, db_path: str):
+    def __init__(self, db_path: str):
         pass
 
-    @classmethod
-    def change_database(cls, db_path: str):
-        cls.__engine = create_async_engine('sqlite+aiosqlite:///' + str(db_path))
-        cls.__session = sessionmaker(cls.__engine, expire_on_commit=False, class_=AsyncSession)
-
     #   Add a new team record to the TeamRecord
     #   The key-value pair in dict must match the parameter of Record
     #   i.e. member_id, team_id, team_list, us_list
+    #   The existence check and the insertion are done by a single INSERT ... SELECT ... WHERE NOT EXISTS
     @debugger
     async def add(self, info: dict):
-        existence = await self._search_single(info['member_id'], info['team_id'])
-        if existence:
-            return {'result': None, 'code': DBStatusCode.RECORD_ALREADY_EXIST}
+        member_id, team_id = str(info['member_id']), int(info['team_id'])
+
+        async with self.__registry.session.begin() as async_session:
+            values = select(
+                literal(member_id), literal(team_id), literal(info['team_list']), literal(info['us_list'])
+            ).where(~exists().where(and_(
+                Team.member_id == member_id,
+                Team.team_id == team_id
+            )))
+            stmt = insert(Team).from_select(['member_id', 'team_id', 'team_list', 'us_list'], values)
+            result = await async_session.execute(stmt)
 
-        async with self.__session.begin() as async_session:
-            async_session.add(Team(**info))
+        if result.rowcount == 0:
+            return {'result': None, 'code': DBStatusCode.RECORD_ALREADY_EXIST}
 
         #   Nothing is returned for adding
         return {'result': None, 'code': DBStatusCode.INSERT_SUCCESS}
@@ -57,16 +50,19 @@ class TeamController(object):
     #   Deletion is performed based on member_id and team_id
     @debugger
     async def delete(self, member_id: str, team_id: int):
-        existence = await self._search_single(member_id, team_id)
-        if not existence:
+        member_id = member_aliases.resolve(str(member_id), str(member_id))
+        if member_id is None:
             return {'result': None, 'code': DBStatusCode.RECORD_NOT_EXIST}
 
-        async with self.__session.begin() as async_session:
+        async with self.__registry.session.begin() as async_session:
             stmt = delete(Team).where(and_(
                 Team.member_id == member_id,
                 Team.team_id == team_id
             ))
-            await async_session.execute(stmt)
+            result = await async_session.execute(stmt)
+
+        if result.rowcount == 0:
+            return {'result': None, 'code': DBStatusCode.RECORD_NOT_EXIST}
 
         #   Nothing is returned for removing
         return {'result': None, 'code': DBStatusCode.DELETE_SUCCESS}
@@ -76,18 +72,21 @@ class TeamController(object):
     #   i.e. member_id, team_id, team_list, us_list
     @debugger
     async def update(self, info: dict):
-        existence = await self._search_single(info['member_id'], info['team_id'])
-        if not existence:
+        member_id = member_aliases.resolve(str(info['member_id']), str(info['member_id']))
+        if member_id is None:
             return {'result': None, 'code': DBStatusCode.RECORD_NOT_EXIST}
 
-        async with self.__session.begin() as async_session:
+        async with self.__registry.session.begin() as async_session:
             stmt = update(Team).where(
                 and_(
-                    Member.member_id == info['member_id'],
+                    Team.member_id == member_id,
                     Team.team_id == info['team_id']
                 )
-            ).values(**info)
-            await async_session.execute(stmt)
+            ).values(team_list=info['team_list'], us_list=info['us_list'])
+            result = await async_session.execute(stmt)
+
+        if result.rowcount == 0:
+            return {'result': None, 'code': DBStatusCode.RECORD_NOT_EXIST}
 
         return {'result': None, 'code': DBStatusCode.UPDATE_SUCCESS}
 
@@ -103,7 +102,7 @@ class TeamController(object):
     #   Search team records for a member in the CompanyInfo
     @debugger
     async def search_member(self, member_identifier: str):
-        async with self.__session.begin() as async_session:
+        async with self.__registry.session.begin() as async_session:
             stmt = select(Member).options(
                 selectinload(Member.teams)
             ).filter(
@@ -124,13 +123,17 @@ class TeamController(object):
         else:
             return {'result': [], 'code': DBStatusCode.SEARCH_FAIL}
 
-    #   Helper method for searching team record
+    #   Helper method for searching team record, the member is resolved by the alias index
     async def _search_single(self, member_identifier: str, team_id: int) -> Team:
-        async with self.__session.begin() as async_session:
+        member_id = member_aliases.resolve(str(member_identifier), str(member_identifier))
+        if member_id is None:
+            return None
+
+        async with self.__registry.session.begin() as async_session:
             query = await async_session.stream(
                 select(Team).filter(
                     and_(
-                        or_(Member.member_id == member_identifier, Member.alias == member_identifier),
+                        Team.member_id == member_id,
                         Team.team_id == team_id
                     )
                 ).order_by(Team.record_id.asc())
@@ -13,6 +13,9 @@ from . import data_source as ds
 global_config = nonebot.get_driver().config
 plugin_config = Config(**global_config.dict())
 
+card_resource = nonebot.require('GameResourceManager')
+card_data = card_resource.card_data
+
 helper = on_command(
     cmd='helper_team',
     aliases={'队伍管理'},
@@ -96,13 +99,23 @@ async def add_team_handler(bot: cqhttp.Bot, event: cqhttp.GroupMessageEvent, sta
         elif action == 'abort':
             await add_team.finish(InteractionMessage.RECORD_CHANGE_ABORT)
         else:
-            card = action.split(plugin_config.separator)
+            card = list(map(str.strip, action.split(plugin_config.separator)))
             if len(card) != 2:
                 await add_team.reject(prompt=InteractionMessage.INVALID_ARG_NUMBER)
-            else:
-                state['team_list'].append(card[0])
-                state['us_list'].append(card[1])
-                await add_team.reject(prompt=InteractionMessage.REPEATE_ADD_TEAM_CARD)
+
+            if card_data.size:
+                #   Cards are stored by card ID once the card catalogue has been grabbed
+                match = card_resource.resolve_card(card[0])
+                if match['card_id'] is None:
+                    if match['candidates']:
+                        await add_team.reject(prompt=card_resource.candidates_message(match['candidates']))
+                    else:
+                        await add_team.reject(prompt=InteractionMessage.CARD_NOT_FOUND.format(card[0]))
+                card[0] = str(match['card_id'])
+
+            state['team_list'].append(card[0])
+            state['us_list'].append(card[1])
+            await add_team.reject(prompt=InteractionMessage.REPEATE_ADD_TEAM_CARD)
 
     team_info = {
         'member_id': state['member_id'],
@@ -232,5 +245,14 @@ async def search_boss_handler(bot: cqhttp.Bot, event: cqhttp.GroupMessageEvent,
 
 def _info_format(raw_info: dict):
     return '\tQQ号: {}; 队伍序号: {};\n'.format(raw_info['member_id'], raw_info['team_id']) + \
-           '\t队伍卡组: {}\n'.format(raw_info['team_list']) + \
+           '\t队伍卡组: {}\n'.format(_card_names(raw_info['team_list'])) + \
            '\t队伍us: {}'.format(raw_info['us_list'])
+
+
+#   Teams store card IDs, older teams may still hold the card names typed by members
+def _card_names(team_list: str) -> str:
+    names = []
+    for card in team_list.split(','):
+        name = card_data.name_of(int(card)) if card.isdigit() else None
+        names.append(name if name is not None else card)
+    return ','.join(names)
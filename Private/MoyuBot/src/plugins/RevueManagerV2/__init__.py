@@ -1,24 +1,134 @@
+import asyncio
+import json
+import time
 from pathlib import Path
 
+import logging
+
 import nonebot
+import nonebot.log as log
 import nonebot.typing as typing
 import nonebot.permission as permission
 import nonebot.adapters.cqhttp as cqhttp
 
+from .config import Config
 from .constants import InteractionMessage
 from . import data_source
+from .metrics import metrics
+from .slowlog import slow_queries, logger as slow_query_logger
 from . import MemberManager, BossManager, RecordManager, TeamManager
 
 from nonebot.plugin import on_command
+from nonebot.message import event_preprocessor
 
 
 bot_driver = nonebot.get_driver()
+plugin_config = Config(**bot_driver.config.dict())
 
-bot_driver.on_startup(
-    lambda: data_source.init_database(str(
-        Path.cwd().joinpath('Data/Company').joinpath('ORMTest').joinpath('Revue.db')
-    ))
-)
+slow_queries.threshold = plugin_config.slow_query_threshold_ms / 1000
+slow_queries.capacity = plugin_config.slow_query_capacity
+slow_queries.explain = plugin_config.slow_query_explain
+#   Slow queries show up in the bot's log
+slow_query_logger.addHandler(log.LoguruHandler())
+slow_query_logger.setLevel(logging.WARNING)
+
+
+async def init_database():
+    await data_source.init_database(
+        str(Path.cwd().joinpath('Data/Company').joinpath('ORMTest').joinpath('Revue.db')),
+        batch_size=plugin_config.record_batch_size,
+        batch_delay=plugin_config.record_batch_delay,
+        pool_size=plugin_config.database_pool_size,
+        max_overflow=plugin_config.database_max_overflow,
+        pool_timeout=plugin_config.database_pool_timeout,
+        busy_timeout=plugin_config.database_busy_timeout
+    )
+
+
+metrics_exporter = None
+
+
+async def export_metrics():
+    while True:
+        await asyncio.sleep(plugin_config.metrics_export_interval)
+        try:
+            metrics.export(plugin_config.metrics_export_path)
+        except OSError:
+            #   The collector directory may come and go, try again next time
+            pass
+
+
+async def start_metrics_exporter():
+    global metrics_exporter
+    if plugin_config.metrics_export_path:
+        metrics_exporter = asyncio.ensure_future(export_metrics())
+
+
+async def stop_metrics_exporter():
+    if metrics_exporter is not None:
+        metrics_exporter.cancel()
+
+
+#   Group messages waiting to be appended to the capture file, None while capturing is off
+capture_queue = None
+capture_writer = None
+
+
+def _append_captured(lines: list):
+    with open(plugin_config.event_capture_path, 'a', encoding='utf-8') as f:
+        f.writelines(lines)
+
+
+#   Append captured messages off the event loop, whatever queued up meanwhile is written at once
+async def write_captured_events():
+    loop = asyncio.get_running_loop()
+    while True:
+        lines = [await capture_queue.get()]
+        while not capture_queue.empty():
+            lines.append(capture_queue.get_nowait())
+        try:
+            await loop.run_in_executor(None, _append_captured, lines)
+        except OSError:
+            #   Capturing must never stop the bot, these messages are lost
+            pass
+
+
+async def start_event_capture():
+    global capture_queue, capture_writer
+    if plugin_config.event_capture_path:
+        capture_queue = asyncio.Queue()
+        capture_writer = asyncio.ensure_future(write_captured_events())
+
+
+async def stop_event_capture():
+    if capture_writer is not None:
+        capture_writer.cancel()
+        lines = []
+        while not capture_queue.empty():
+            lines.append(capture_queue.get_nowait())
+        if lines:
+            _append_captured(lines)
+
+
+#   Record group messages as replay.py reads them, with the arrival time for replaying at the original pace
+@event_preprocessor
+async def capture_event(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    if capture_queue is None or not isinstance(event, cqhttp.GroupMessageEvent):
+        return
+
+    capture_queue.put_nowait(json.dumps({
+        'timestamp': time.time(),
+        'self_id': bot.self_id,
+        'event': json.loads(event.json())
+    }, ensure_ascii=False) + '\n')
+
+
+bot_driver.on_startup(init_database)
+bot_driver.on_startup(start_metrics_exporter)
+bot_driver.on_startup(start_event_capture)
+bot_driver.on_shutdown(stop_metrics_exporter)
+bot_driver.on_shutdown(stop_event_capture)
+bot_driver.on_shutdown(data_source.close_database)
 
 # test_message_helper = on_command('test_message', aliases={'tm'}, priority=10)
 
@@ -34,6 +144,38 @@ clear_db = on_command(
     priority=1
 )
 
+migrate_db = on_command(
+    cmd='MIGRATE',
+    permission=permission.SUPERUSER,
+    priority=1
+)
+
+cache_status = on_command(
+    cmd='CACHE',
+    permission=permission.SUPERUSER,
+    priority=1
+)
+
+rebuild_rollup = on_command(
+    cmd='ROLLUP',
+    permission=permission.SUPERUSER,
+    priority=1
+)
+
+slow_query_status = on_command(
+    cmd='SLOWLOG',
+    aliases={'slowlog'},
+    permission=permission.SUPERUSER,
+    priority=1
+)
+
+metrics_status = on_command(
+    cmd='METRICS',
+    aliases={'metrics'},
+    permission=permission.SUPERUSER,
+    priority=1
+)
+
 
 @overall_helper.handle()
 async def helper_handler(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
@@ -48,6 +190,80 @@ async def clearance(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State)
     await clear_db.finish('Cleared database at: {}'.format(str(db_file)))
 
 
+@migrate_db.handle()
+async def migration(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    migrate_result = await data_source.migrate_database()
+
+    if migrate_result['error'] is not None:
+        await migrate_db.finish('Migration failed:\n{}'.format(migrate_result['error']))
+    elif migrate_result['response']:
+        await migrate_db.finish('Created indexes: {}'.format(', '.join(migrate_result['response'])))
+    else:
+        await migrate_db.finish('All indexes already exist.')
+
+
+@cache_status.handle()
+async def cache_statistics(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    await cache_status.finish('\n'.join(map(
+        lambda stats: '{}: size {}, hits {}, misses {}'.format(
+            stats['name'], stats['size'], stats['hits'], stats['misses']
+        ),
+        data_source.cache_stats()
+    )))
+
+
+@rebuild_rollup.handle()
+async def rollup_backfill(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    rebuild_result = await data_source.rc.rebuild_statistics()
+
+    if rebuild_result['error'] is not None:
+        await rebuild_rollup.finish('Rebuild failed:\n{}'.format(rebuild_result['error']))
+    else:
+        await rebuild_rollup.finish('Rebuilt {} daily damage rows.'.format(rebuild_result['response']['result']))
+
+
+#   METRICS: slowest methods first, METRICS RESET: start counting again
+@metrics_status.handle()
+async def metrics_statistics(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    if str(event.get_message()).strip().upper() == 'RESET':
+        metrics.reset()
+        await metrics_status.finish('Metrics reset.')
+
+    snapshot = metrics.snapshot()
+    if not snapshot:
+        await metrics_status.finish('No calls recorded.')
+
+    await metrics_status.finish('\n'.join(map(
+        lambda stats: '{}: calls {}, errors {}, p50/p95/p99 {}/{}/{}ms, db {}ms, python {}ms'.format(
+            stats['name'], stats['calls'], stats['errors'],
+            stats['p50'], stats['p95'], stats['p99'], stats['db'], stats['python']
+        ),
+        snapshot
+    )))
+
+
+#   SLOWLOG: statements with the most total time, SLOWLOG RESET: start counting again
+@slow_query_status.handle()
+async def slow_query_statistics(bot: cqhttp.Bot, event: cqhttp.Event, state: typing.T_State):
+    if str(event.get_message()).strip().upper() == 'RESET':
+        slow_queries.reset()
+        await slow_query_status.finish('Slow query log reset.')
+
+    worst = slow_queries.top(plugin_config.slow_query_report_size)
+    if not worst:
+        await slow_query_status.finish('No queries recorded.')
+
+    await slow_query_status.finish('\n\n'.join(map(
+        lambda stats: 'total {:.1f}ms, calls {}, slow {}, max {:.1f}ms\n{}{}{}'.format(
+            stats.total * 1000, stats.calls, stats.slow_calls, stats.max * 1000,
+            stats.statement[:300],
+            '\nparameters: {}'.format(stats.parameters) if stats.parameters is not None else '',
+            '\nplan: {}'.format('; '.join(stats.plan)) if stats.plan else ''
+        ),
+        worst
+    )))
+
+
 # @test_message_helper.handle()
 # async def message_helper(bot: cqhttp.Bot, event: cqhttp.GroupMessageEvent, state: typing.T_State):
 #     pass
@@ -0,0 +1,94 @@
+import asyncio
+
+from .metrics import metrics
+
+
+#   Gather submitted items for a short time window (or until the batch is full),
+#   then hand them to a single flush call so that they share one transaction.
+#   :param flush: coroutine function taking a list of items and returning a list of per-item results,
+#       a result that is an Exception is raised to the caller who submitted that item
+#   :param max_size: flush immediately once this many items are waiting
+#   :param max_delay: seconds to wait for more items after the first one arrives
+class WriteBehindBatcher(object):
+
+    def __init__(self, flush, max_size: int = 64, max_delay: float = 0.05):
+        self._flush = flush
+        self._max_size = max(1, int(max_size))
+        self._max_delay = max(0.0, float(max_delay))
+
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        #   future -> database time of its batch divided among the batch, charged to the caller's metrics
+        self._db_shares = {}
+        #   Flushes are serialized, sqlite only allows one writer anyway
+        self._lock = asyncio.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    #   Queue a single item and wait until the batch containing it is committed
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self._max_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._max_delay, self._start_flush)
+
+        try:
+            return await future
+        finally:
+            metrics.add_db_time(self._db_shares.pop(future, 0.0))
+
+    #   Flush everything that is queued and wait for all running flushes
+    async def drain(self):
+        self._start_flush()
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list):
+        async with self._lock:
+            token = metrics.start()
+            try:
+                results = await self._flush([item for item, _ in batch])
+                error = None
+            except Exception as e:
+                error = e
+
+            _, db_seconds = metrics.stop(token)
+            for _, future in batch:
+                if not future.done():
+                    self._db_shares[future] = db_seconds / len(batch)
+
+            if error is not None:
+                #   The whole transaction failed, every caller in the batch gets the error
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                return
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                #   The caller has given up waiting
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
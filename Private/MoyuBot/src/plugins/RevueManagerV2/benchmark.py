@@ -0,0 +1,549 @@
+#   Benchmarks for RevueManagerV2 controllers
+#   Run as a script from anywhere, e.g.
+#       python benchmark.py indexes --sizes 10000 100000 1000000
+#       python benchmark.py writes --operations 2000
+#       python benchmark.py leaderboard --sizes 10000 100000
+#       python benchmark.py guild --clients 20 --operations 5000 --output guild.json
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+if __package__ in (None, ''):
+    #   Load the plugin modules without running the plugin __init__, which needs a nonebot driver
+    _package = types.ModuleType('RevueManagerV2')
+    _package.__path__ = [str(Path(__file__).resolve().parent)]
+    sys.modules['RevueManagerV2'] = _package
+    __package__ = 'RevueManagerV2'
+
+from sqlalchemy import delete, update, or_, and_
+from sqlalchemy.future import select
+
+from . import data_source, model
+from .model import Member, Boss, Team
+
+DAY = 24 * 3600
+SEASON_START = 1622520000
+
+
+#   Latency summary in milliseconds
+def _summary(latencies: list) -> dict:
+    ordered = sorted(latencies)
+    return {
+        'count': len(ordered),
+        'p50': round(statistics.median(ordered) * 1000, 3),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        'p99': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+        'max': round(ordered[-1] * 1000, 3)
+    }
+
+
+async def _timed(coroutine_function, arguments: list) -> list:
+    latencies = []
+    for args in arguments:
+        start = time.perf_counter()
+        result = await coroutine_function(*args)
+        latencies.append(time.perf_counter() - start)
+        if result['error'] is not None:
+            raise RuntimeError(result['error'])
+    return latencies
+
+
+#   Fill a fresh database with synthetic members, bosses and records
+#   The plain sqlite3 module is used here since generating the data is not what is measured
+def _populate(db_path: str, members: int, levels: int, records: int, days: int, seed: int = 0, bosses: int = 4):
+    rng = random.Random(seed)
+
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        'INSERT INTO CompanyInfo (member_id, alias, account, password) VALUES (?, ?, ?, ?)',
+        [(str(10000 + i), 'member{}'.format(i), 'account{}'.format(i), 'password{}'.format(i)) for i in range(members)]
+    )
+    boss_ids = [level * 100 + i for level in range(1, levels + 1) for i in range(1, bosses + 1)]
+    conn.executemany(
+        'INSERT INTO BossInfo (boss_id, alias, health) VALUES (?, ?, ?)',
+        [(boss_id, 'R{}B{}'.format(boss_id // 100, boss_id % 100), 1000000 * (boss_id // 100)) for boss_id in boss_ids]
+    )
+    conn.executemany(
+        'INSERT INTO RevueRecord (member_id, boss_id, damage, sequence, turn, team, date_time) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (
+            (
+                str(10000 + rng.randrange(members)),
+                rng.choice(boss_ids),
+                rng.randrange(10000, 2000000),
+                rng.randint(1, 3),
+                rng.randint(1, 6),
+                rng.randint(1, 5),
+                SEASON_START + rng.randrange(days * DAY)
+            ) for _ in range(records)
+        )
+    )
+    conn.commit()
+    conn.close()
+
+    return boss_ids
+
+
+async def _search_latencies(members: int, boss_ids: list, days: int, queries: int, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+
+    def day_range():
+        start = SEASON_START + rng.randrange(days) * DAY
+        return start, start + DAY - 1
+
+    member_args = [('member{}'.format(rng.randrange(members)), day_range()) for _ in range(queries)]
+    boss_args = [(str(rng.choice(boss_ids)), day_range()) for _ in range(queries)]
+
+    return {
+        'search_by_member': _summary(await _timed(data_source.rc.search_by_member, member_args)),
+        'search_by_boss': _summary(await _timed(data_source.rc.search_by_boss, boss_args))
+    }
+
+
+#   Search latency on RevueRecord before and after data_source.migrate_database creates the indexes
+async def bench_indexes(args) -> dict:
+    report = {}
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = str(Path(directory).joinpath('Revue.db'))
+
+            await data_source.init_database(db_path)
+
+            #   Drop the indexes to measure the unindexed case first
+            async with data_source.registry.engine.begin() as conn:
+                for table in model.Base.metadata.sorted_tables:
+                    for index in table.indexes:
+                        await conn.run_sync(index.drop)
+
+            boss_ids = _populate(db_path, args.members, args.levels, size, args.days)
+            await data_source.load_caches()
+
+            before = await _search_latencies(args.members, boss_ids, args.days, args.queries)
+            migrate_result = await data_source.migrate_database()
+            if migrate_result['error'] is not None:
+                raise RuntimeError(migrate_result['error'])
+            after = await _search_latencies(args.members, boss_ids, args.days, args.queries)
+
+            report[str(size)] = {'without_indexes': before, 'with_indexes': after}
+            await data_source.close_database()
+
+    return report
+
+
+#   The check-then-write pattern the controllers used before, kept here as the baseline
+#   Every operation runs a lookup transaction followed by a write transaction
+async def _legacy_member_cycle(index: int):
+    session = data_source.registry.session
+    member_id, alias = str(20000 + index), 'legacy{}'.format(index)
+
+    async def exists():
+        async with session.begin() as async_session:
+            query = await async_session.stream(
+                select(Member).filter(or_(Member.member_id == member_id, Member.alias == alias))
+            )
+            return await query.scalars().first()
+
+    if not await exists():
+        async with session.begin() as async_session:
+            async_session.add(Member(member_id, alias, 'account', 'password'))
+    if await exists():
+        async with session.begin() as async_session:
+            await async_session.execute(
+                update(Member).where(Member.member_id == member_id).values(account='changed')
+            )
+    if await exists():
+        async with session.begin() as async_session:
+            await async_session.execute(delete(Member).where(Member.member_id == member_id))
+
+
+async def _legacy_boss_cycle(index: int):
+    session = data_source.registry.session
+    boss_id, alias = 900000 + index, 'legacy{}'.format(index)
+
+    async def exists():
+        async with session.begin() as async_session:
+            query = await async_session.stream(
+                select(Boss).filter(or_(Boss.boss_id == boss_id, Boss.alias == alias))
+            )
+            return await query.scalars().first()
+
+    if not await exists():
+        async with session.begin() as async_session:
+            async_session.add(Boss(boss_id, alias, 100))
+    if await exists():
+        async with session.begin() as async_session:
+            await async_session.execute(update(Boss).where(Boss.boss_id == boss_id).values(health=200))
+    if await exists():
+        async with session.begin() as async_session:
+            await async_session.execute(delete(Boss).where(Boss.boss_id == boss_id))
+
+
+async def _legacy_team_cycle(index: int):
+    session = data_source.registry.session
+    member_id, team_id = '10000', 1000 + index
+
+    async def exists():
+        async with session.begin() as async_session:
+            query = await async_session.stream(
+                select(Team).filter(and_(Team.member_id == member_id, Team.team_id == team_id))
+            )
+            return await query.scalars().first()
+
+    if not await exists():
+        async with session.begin() as async_session:
+            async_session.add(Team(member_id, team_id, 'card', 'us'))
+    if await exists():
+        async with session.begin() as async_session:
+            await async_session.execute(
+                update(Team).where(and_(Team.member_id == member_id, Team.team_id == team_id)).values(us_list='us2')
+            )
+    if await exists():
+        async with session.begin() as async_session:
+            await async_session.execute(
+                delete(Team).where(and_(Team.member_id == member_id, Team.team_id == team_id))
+            )
+
+
+async def _member_cycle(index: int):
+    info = {'member_id': str(20000 + index), 'alias': 'current{}'.format(index),
+            'account': 'account', 'password': 'password'}
+    await data_source.mc.add(info)
+    await data_source.mc.update(dict(info, account='changed'))
+    await data_source.mc.delete(info['member_id'])
+
+
+async def _boss_cycle(index: int):
+    info = {'boss_id': 900000 + index, 'alias': 'current{}'.format(index), 'health': 100}
+    await data_source.bc.add(info)
+    await data_source.bc.update(dict(info, health=200))
+    await data_source.bc.delete(info['boss_id'])
+
+
+async def _team_cycle(index: int):
+    info = {'member_id': '10000', 'team_id': 1000 + index, 'team_list': 'card', 'us_list': 'us'}
+    await data_source.tc.add(info)
+    await data_source.tc.update(dict(info, us_list='us2'))
+    await data_source.tc.delete(info['member_id'], info['team_id'])
+
+
+async def _operations_per_second(cycle, operations: int) -> float:
+    cycles = max(1, operations // 3)
+    start = time.perf_counter()
+    for index in range(cycles):
+        await cycle(index)
+    return round(cycles * 3 / (time.perf_counter() - start), 1)
+
+
+#   Throughput of add/update/delete with the old check-then-write pattern and with the controllers
+async def bench_writes(args) -> dict:
+    report = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = str(Path(directory).joinpath('Revue.db'))
+        await data_source.init_database(db_path)
+        _populate(db_path, args.members, args.levels, args.records, args.days)
+        await data_source.load_caches()
+
+        for name, legacy, current in [
+            ('member', _legacy_member_cycle, _member_cycle),
+            ('boss', _legacy_boss_cycle, _boss_cycle),
+            ('team', _legacy_team_cycle, _team_cycle)
+        ]:
+            report[name] = {
+                'check_then_write_ops': await _operations_per_second(legacy, args.operations),
+                'single_statement_ops': await _operations_per_second(current, args.operations)
+            }
+
+        await data_source.close_database()
+
+    return report
+
+
+#   The naive leaderboard: search every member and sum the damage in Python
+async def _naive_leaderboard(time_range: tuple, limit: int) -> list:
+    members = (await data_source.mc.list())['response']['result']
+
+    totals = []
+    for member in members:
+        records = (await data_source.rc.search_by_member(member['member_id'], time_range))['response']['result']
+        if records:
+            totals.append((sum(record['damage'] for record in records), member['member_id']))
+
+    return sorted(totals, reverse=True)[:limit]
+
+
+#   RecordController.leaderboard against searching every member
+async def bench_leaderboard(args) -> dict:
+    report = {}
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = str(Path(directory).joinpath('Revue.db'))
+            await data_source.init_database(db_path)
+            _populate(db_path, args.members, args.levels, size, args.days)
+            await data_source.load_caches()
+
+            day = (SEASON_START + DAY, SEASON_START + 2 * DAY - 1)
+            season = (SEASON_START, SEASON_START + args.days * DAY)
+            report[str(size)] = {}
+            for name, time_range in [('daily', day), ('season', season)]:
+                naive = [await _timed_call(_naive_leaderboard, time_range, 10) for _ in range(args.queries)]
+                window = await _timed(data_source.rc.leaderboard, [(time_range, None, 10)] * args.queries)
+                report[str(size)][name] = {
+                    'per_member_loop': _summary(naive),
+                    'window_function': _summary(window)
+                }
+
+            await data_source.close_database()
+
+    return report
+
+
+async def _timed_call(coroutine_function, *args) -> float:
+    start = time.perf_counter()
+    await coroutine_function(*args)
+    return time.perf_counter() - start
+
+
+#   Share of each command in the guild workload, in the order members use them during a revue
+GUILD_MIX = {
+    'record_add': 40,
+    'record_delete': 1,
+    'search_by_member': 10,
+    'search_by_boss': 6,
+    'page_by_member': 4,
+    'leaderboard': 6,
+    'statistics': 4,
+    'boss_progress': 8,
+    'boss_search': 4,
+    'member_search': 5,
+    'member_list': 2,
+    'team_search': 8,
+    'team_update': 2
+}
+
+
+def _parse_mix(text: str) -> dict:
+    mix = dict(GUILD_MIX)
+    if text:
+        for pair in text.split(','):
+            name, weight = pair.split('=')
+            if name not in GUILD_MIX:
+                raise ValueError('Unknown operation: {}'.format(name))
+            mix[name] = int(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def _populate_teams(db_path: str, members: int, teams: int):
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        'INSERT INTO TeamRecord (member_id, team_id, team_list, us_list) VALUES (?, ?, ?, ?)',
+        [
+            (str(10000 + i), team_id, '1010001,1020001,1030001,1040001,1050001', 'us1,us2,us3,us4,us5')
+            for i in range(members) for team_id in range(1, teams + 1)
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).resolve().parent,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+#   Commands of one member of the synthetic guild
+#   The current revue day is the last generated day, hits go to the bosses of the highest level
+class _GuildClient(object):
+
+    def __init__(self, args, boss_ids: list, seed: int):
+        self.rng = random.Random(seed)
+        self.args = args
+        self.current_bosses = boss_ids[-args.bosses:]
+        self.boss_ids = boss_ids
+        self.today = SEASON_START + (args.days - 1) * DAY
+        self.added = []
+
+    def member(self) -> str:
+        return str(10000 + self.rng.randrange(self.args.members))
+
+    def day_range(self) -> tuple:
+        start = SEASON_START + self.rng.randrange(self.args.days) * DAY
+        return start, start + DAY - 1
+
+    def operation(self, name: str):
+        rng = self.rng
+        rc, bc, mc, tc = data_source.rc, data_source.bc, data_source.mc, data_source.tc
+
+        if name == 'record_delete' and self.added:
+            return rc.delete(*self.added.pop())
+        if name in ('record_add', 'record_delete'):
+            info = {
+                'member_id': self.member(),
+                'boss_id': rng.choice(self.current_bosses),
+                'damage': rng.randrange(10000, 2000000),
+                'sequence': rng.randint(1, 3),
+                'turn': rng.randint(1, 6),
+                'team': rng.randint(1, 5),
+                'date_time': self.today + rng.randrange(DAY)
+            }
+            self.added.append((info['member_id'], str(info['boss_id']), info['damage']))
+            return rc.add(info)
+        if name == 'search_by_member':
+            return rc.search_by_member('member{}'.format(rng.randrange(self.args.members)), self.day_range())
+        if name == 'search_by_boss':
+            return rc.search_by_boss(str(rng.choice(self.current_bosses)), (self.today, self.today + DAY - 1))
+        if name == 'page_by_member':
+            return rc.page_by_member(self.member(), (), None, 10, 10 * rng.randrange(3))
+        if name == 'leaderboard':
+            return rc.leaderboard(rng.choice([(), (self.today, self.today + DAY - 1)]))
+        if name == 'statistics':
+            return rc.statistics(())
+        if name == 'boss_progress':
+            return bc.progress()
+        if name == 'boss_search':
+            return bc.search('R{}B{}'.format(self.current_bosses[0] // 100, rng.randint(1, self.args.bosses)))
+        if name == 'member_search':
+            return mc.search('member{}'.format(rng.randrange(self.args.members)))
+        if name == 'member_list':
+            return mc.list()
+        if name == 'team_search':
+            return tc.search_member(self.member())
+        if name == 'team_update':
+            return tc.update({
+                'member_id': self.member(), 'team_id': rng.randint(1, self.args.teams),
+                'team_list': '1010001,1020001,1030001,1040001,1050001', 'us_list': 'us{}'.format(rng.randrange(100))
+            })
+        raise ValueError('Unknown operation: {}'.format(name))
+
+
+#   Closed loop of concurrent members sending a realistic command mix against a synthetic guild
+#   Reported per operation: throughput and latency percentiles, controller errors are counted, not raised
+async def bench_guild(args) -> dict:
+    mix = _parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = str(Path(directory).joinpath('Revue.db'))
+        await data_source.init_database(db_path)
+        boss_ids = _populate(
+            db_path, args.members, args.levels, args.records_per_day * args.days, args.days, args.seed, args.bosses
+        )
+        _populate_teams(db_path, args.members, args.teams)
+        await data_source.load_caches()
+        rebuild_result = await data_source.rc.rebuild_statistics()
+        if rebuild_result['error'] is not None:
+            raise RuntimeError(rebuild_result['error'])
+
+        latencies = {name: [] for name in names}
+        errors = {name: 0 for name in names}
+        remaining = [args.operations]
+
+        async def client(index: int):
+            guild_client = _GuildClient(args, boss_ids, args.seed * 1000 + index)
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                name = guild_client.rng.choices(names, weights)[0]
+
+                start = time.perf_counter()
+                result = await guild_client.operation(name)
+                latencies[name].append(time.perf_counter() - start)
+                errors[name] += result['error'] is not None
+
+                if args.think:
+                    await asyncio.sleep(guild_client.rng.expovariate(1000 / args.think))
+
+        start = time.perf_counter()
+        await asyncio.gather(*[client(index) for index in range(args.clients)])
+        await data_source.rc.flush()
+        elapsed = time.perf_counter() - start
+
+        await data_source.close_database()
+
+    report = {
+        'commit': _commit(),
+        'config': {
+            key: value for key, value in vars(args).items() if key not in ('run', 'benchmark', 'output')
+        },
+        'mix': mix,
+        'elapsed': round(elapsed, 3),
+        'throughput': round(args.operations / elapsed, 1),
+        'operations': {
+            name: dict(
+                _summary(latencies[name]),
+                errors=errors[name],
+                throughput=round(len(latencies[name]) / elapsed, 1)
+            )
+            for name in names if latencies[name]
+        }
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RevueManagerV2 benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    indexes = subparsers.add_parser('indexes', help='record search latency with and without indexes')
+    indexes.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    indexes.add_argument('--members', type=int, default=30)
+    indexes.add_argument('--levels', type=int, default=50)
+    indexes.add_argument('--days', type=int, default=120)
+    indexes.add_argument('--queries', type=int, default=200)
+    indexes.set_defaults(run=bench_indexes)
+
+    writes = subparsers.add_parser('writes', help='add/update/delete throughput of the controllers')
+    writes.add_argument('--operations', type=int, default=3000)
+    writes.add_argument('--members', type=int, default=30)
+    writes.add_argument('--levels', type=int, default=50)
+    writes.add_argument('--records', type=int, default=10000)
+    writes.add_argument('--days', type=int, default=120)
+    writes.set_defaults(run=bench_writes)
+
+    leaderboard = subparsers.add_parser('leaderboard', help='leaderboard query against a per-member loop')
+    leaderboard.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    leaderboard.add_argument('--members', type=int, default=30)
+    leaderboard.add_argument('--levels', type=int, default=50)
+    leaderboard.add_argument('--days', type=int, default=120)
+    leaderboard.add_argument('--queries', type=int, default=20)
+    leaderboard.set_defaults(run=bench_leaderboard)
+
+    guild = subparsers.add_parser('guild', help='concurrent command mix against a synthetic guild')
+    guild.add_argument('--members', type=int, default=30)
+    guild.add_argument('--bosses', type=int, default=4, help='bosses per level')
+    guild.add_argument('--levels', type=int, default=20)
+    guild.add_argument('--records-per-day', type=int, default=90)
+    guild.add_argument('--days', type=int, default=14)
+    guild.add_argument('--teams', type=int, default=3, help='teams per member')
+    guild.add_argument('--clients', type=int, default=20, help='members sending commands at the same time')
+    guild.add_argument('--operations', type=int, default=5000)
+    guild.add_argument('--think', type=float, default=0, help='mean pause between commands of a member in ms')
+    guild.add_argument('--mix', default='', help='weights overriding the default mix, e.g. record_add=80,leaderboard=20')
+    guild.add_argument('--seed', type=int, default=0)
+    guild.add_argument('--output', help='also write the report to this file, e.g. to compare commits')
+    guild.set_defaults(run=bench_guild)
+
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(args.run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
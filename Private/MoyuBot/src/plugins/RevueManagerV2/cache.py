@@ -0,0 +1,128 @@
+#   In-process caches shared by the controllers
+#   They are filled from the database at startup and kept in sync by the controllers' write paths
+
+
+#   Bidirectional alias <-> id index
+#   Aliases are not unique in the database, an alias resolves to the first id registered with it,
+#   which matches the first() lookup the controllers used to do
+class AliasIndex(object):
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+        self._alias_of = {}
+        self._id_of = {}
+
+    def load(self, pairs):
+        self._alias_of.clear()
+        self._id_of.clear()
+        for record_id, alias in pairs:
+            self.put(record_id, alias)
+
+    def put(self, record_id, alias: str):
+        old_alias = self._alias_of.get(record_id)
+        if old_alias is not None and old_alias != alias:
+            self._release_alias(old_alias, record_id)
+
+        self._alias_of[record_id] = alias
+        if alias is not None:
+            self._id_of.setdefault(alias, record_id)
+
+    def remove(self, record_id):
+        alias = self._alias_of.pop(record_id, None)
+        if alias is not None:
+            self._release_alias(alias, record_id)
+
+    def has_id(self, record_id) -> bool:
+        return record_id in self._alias_of
+
+    def has_alias(self, alias: str) -> bool:
+        return alias in self._id_of
+
+    def alias_of(self, record_id):
+        return self._alias_of.get(record_id)
+
+    #   Resolve an id or an alias to an id, None if neither is known
+    #   :param record_id: identifier already cast to the id type, None to only match the alias
+    def resolve(self, record_id=None, alias: str = None):
+        if record_id is not None and record_id in self._alias_of:
+            self.hits += 1
+            return record_id
+        if alias is not None and alias in self._id_of:
+            self.hits += 1
+            return self._id_of[alias]
+
+        self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'size': len(self._alias_of),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    #   Point the alias to another id sharing it, or drop it if there is none
+    def _release_alias(self, alias: str, record_id):
+        if self._id_of.get(alias) != record_id:
+            return
+
+        del self._id_of[alias]
+        for other_id, other_alias in self._alias_of.items():
+            if other_alias == alias and other_id != record_id:
+                self._id_of[alias] = other_id
+                break
+
+
+#   Rendered replies of list commands, valid until the listed table changes
+#   Writers bump the generation after committing, a reply rendered from data read under an older
+#   generation is not stored, so a list never outlives the write that changed it.
+class RenderCache(object):
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = {}
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    #   Rendered reply of key, None if it has to be rendered again
+    def get(self, key):
+        if key in self._entries:
+            self.hits += 1
+            return self._entries[key]
+
+        self.misses += 1
+        return None
+
+    #   :param generation: the generation read before loading the data the reply is rendered from
+    def put(self, key, value, generation: int):
+        if generation == self._generation:
+            self._entries[key] = value
+
+    #   The listed table changed, drop every rendered reply
+    def bump(self):
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+member_aliases = AliasIndex('member')
+boss_aliases = AliasIndex('boss')
+member_list = RenderCache('member_list')
+boss_list = RenderCache('boss_list')
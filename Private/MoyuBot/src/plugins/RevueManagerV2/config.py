@@ -18,6 +18,31 @@ class Config(BaseSettings):
 
     default_revue_turn = 6
 
+    database_pool_size: int = 5
+    database_max_overflow: int = 0
+    database_pool_timeout: int = 30
+    database_busy_timeout: int = 5000
+
+    record_batch_size: int = 64
+    record_batch_delay: float = 0.05
+
+    record_page_size: int = 10
+    leaderboard_size: int = 10
+
+    #   Prometheus text file of the controller metrics, written every metrics_export_interval seconds
+    #   Empty to not export, e.g. point it into the node exporter's textfile collector directory
+    metrics_export_path: str = ''
+    metrics_export_interval: float = 15.0
+
+    #   Group messages are appended to this JSONL file for replay.py, empty to not capture
+    event_capture_path: str = ''
+
+    #   Statements slower than this are logged and explained, see slowlog.py
+    slow_query_threshold_ms: float = 100.0
+    slow_query_capacity: int = 200
+    slow_query_explain: bool = True
+    slow_query_report_size: int = 5
+
     separator: str = ','
 
     class Config:
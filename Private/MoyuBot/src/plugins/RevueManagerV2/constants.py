@@ -24,6 +24,9 @@ class InteractionMessage:
     RECORD_LIST_EMPTY = '记录为空。'
     RECORD_LIST_SUCCESS = '记录如下：'
     RECORD_ALREADT_EXIST = '已存在对应记录，请勿重复添加。'
+    RECORD_PAGE = '第 {} 页'
+    BOSS_PROGRESS = '{}({}) 剩余血量 {}/{}'
+    BOSS_KILLED = '已击破'
 
     RECORD_CHANGE_FAIL = '记录更新失败。'
     RECORD_FIND_FAIL = '未找到记录：{}。'
@@ -37,11 +40,14 @@ class InteractionMessage:
     REQUEST_ARG = '未检测到参数，请输入参数。'
     REQUEST_CONFIRM = '请确认操作[y/n]。'
     CONFIRMATION_MESSAGE = ['y', 'n', 'yes', 'no', 'Y', 'N', 'YES', 'NO']
+    REQUEST_NEXT_PAGE = '回复[n]或[下一页]查看下一页，其他任意内容结束查询。'
+    NEXT_PAGE_MESSAGE = ['n', 'N', 'next', '下一页']
 
     REPEATE_ADD_TEAM_CARD = '请输入卡牌名,卡牌us以添加单张卡牌\n' + \
                             '或[confirm]完成录入，[abort]放弃录入'
     REPEATE_ADD_MESSAGE = ['confirm', 'abort']
     NOT_ENOUGH_TEAM = '队伍中必须至少有一张卡牌，请重新添加。'
+    CARD_NOT_FOUND = '卡牌数据库中没有卡牌：{}，请检查卡牌名后重新输入。'
 
     OVERALL_HELPER = '''
     工会战管理插件：
@@ -73,6 +79,8 @@ class InteractionMessage:
     4. /更新boss|ub BossID,Boss名,血量（仅限管理使用）
     5. /搜索boss|sb BossID|Boss名
     6. /boss列表|lb
+    7. /boss进度|bp {BossID|Boss名}
+        查看剩余血量，留空查看全部Boss
     '''.strip()
 
     RECORD_MANAGER_HELP_MESSAGE = '''
@@ -85,12 +93,17 @@ class InteractionMessage:
         {或使用@功能自动获取QQ号，且@为最优先模式}
     2. /删除记录|rr QQ号,BossID,伤害值（仅限管理使用）
     3. /搜索记录|sr 用于查看搜索命令
+    4. /统计|ds {日期(YYYY-MM-DD留空默认为当天)|-all},{BossID|Boss名}
+        按成员汇总伤害
+    5. /排行|rk {日期(YYYY-MM-DD留空默认为当天)|-all},{BossID|Boss名}
+        按总伤害排名
     '''.strip()
 
     RECORD_SEARCH_HELP_MESSAGE = '''
     请使用指定对象的搜索命令：必须{可选}
-    /search_record.member|搜索记录.成员|sr.m QQ号|昵称,{日期(YYYY-MM-DD)|-all}
-    /search_record.boss|搜索记录.boss|sr.b BossID|Boss名,{日期(YYYY-MM-DD)|-all}
+    /search_record.member|搜索记录.成员|sr.m QQ号|昵称,{日期(YYYY-MM-DD)|-all},{page 页码}
+    /search_record.boss|搜索记录.boss|sr.b BossID|Boss名,{日期(YYYY-MM-DD)|-all},{page 页码}
+    结果分页显示，回复[n]或[下一页]查看下一页
     '''.strip()
 
     TEAM_MANAGER_HELPER_MESSAGE = '''
@@ -100,5 +113,6 @@ class InteractionMessage:
         将触发单卡添加模式，请遵循提示
     2. /删除队伍|rt QQ号,个人队伍序号（仅限管理使用）
     3. /查询队伍|st QQ号|昵称(或使用@功能自动获取QQ号，且@为最优先模式),{个人队伍序号}
-    4. 队伍管理模块与卡牌数据库尚在开发，无法提供有效的联动查询，请自行确保队伍中卡牌可识别
+    4. 卡牌可使用卡牌ID、卡牌名(可不完整)或昵称，有多个匹配时请使用卡牌ID
+        卡牌数据库为空时不做检查
     '''.strip()
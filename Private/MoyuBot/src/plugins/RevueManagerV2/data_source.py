@@ -1,25 +1,94 @@
 from . import MemberController, BossController, RecordController, TeamController
-from sqlalchemy.ext.asyncio import create_async_engine
+
+from sqlalchemy import text
 
 from . import model
+from .engine import EngineRegistry
+from .debugger import debugger
+from .cache import member_aliases, boss_aliases, member_list, boss_list
 
+registry: EngineRegistry
 mc: MemberController.MemberController
 bc: BossController.BossController
 rc: RecordController.RecordController
 tc: TeamController.TeamController
 
 
-def init_database(db_path: str):
-    global mc, bc, rc, tc
+#   All controllers share the engine registry built here
+#   :param pool_options: pool_size, max_overflow, pool_timeout, busy_timeout for the EngineRegistry
+#   :param batch_size, batch_delay: write-behind window of RecordController.add
+async def init_database(db_path: str, batch_size: int = 64, batch_delay: float = 0.05, **pool_options):
+    global registry, mc, bc, rc, tc
+    registry = EngineRegistry(db_path, **pool_options)
+    if registry.db_path != str(db_path):
+        #   Initialized again with another database, e.g. by the benchmarks
+        await registry.change_database(db_path)
     mc = MemberController.MemberController(db_path)
     bc = BossController.BossController(db_path)
-    rc = RecordController.RecordController(db_path)
+    rc = RecordController.RecordController(db_path, batch_size, batch_delay)
     tc = TeamController.TeamController(db_path)
 
+    async with registry.engine.begin() as conn:
+        await conn.run_sync(model.Base.metadata.create_all)
+    await load_caches()
+
+
+#   Rebuild the in-process caches from the current database
+async def load_caches():
+    await mc.load_aliases()
+    await bc.load_aliases()
+    await bc.load_progress()
+
+
+def cache_stats() -> list:
+    return [member_aliases.stats(), boss_aliases.stats(), member_list.stats(), boss_list.stats()]
+
+
+#   Swap the database of every controller, the batched records go to the old one and the caches are rebuilt
+async def change_database(db_path: str):
+    await rc.flush()
+    await registry.change_database(db_path)
+    await load_caches()
+
+
+async def close_database():
+    await rc.flush()
+    await registry.dispose()
+
 
 async def reset_database(db_path: str):
-    aioengine = create_async_engine('sqlite+aiosqlite:///' + db_path)
+    await rc.flush()
+    if registry.db_path != str(db_path):
+        await registry.change_database(db_path)
 
-    async with aioengine.begin() as conn:
+    async with registry.engine.begin() as conn:
         await conn.run_sync(model.Base.metadata.drop_all)
         await conn.run_sync(model.Base.metadata.create_all)
+
+    await load_caches()
+
+
+#   Create tables and indexes missing from an existing database without dropping any data
+#   Returns the names of the created indexes
+@debugger
+async def migrate_database():
+    await rc.flush()
+
+    async with registry.engine.begin() as conn:
+        await conn.run_sync(model.Base.metadata.create_all)
+        created = await conn.run_sync(_create_missing_indexes)
+        await conn.execute(text('ANALYZE'))
+
+    return created
+
+
+def _create_missing_indexes(sync_conn) -> list:
+    existing = set(sync_conn.scalars(text("SELECT name FROM sqlite_master WHERE type = 'index'")).all())
+
+    created = []
+    for table in model.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=sync_conn)
+                created.append(index.name)
+    return created
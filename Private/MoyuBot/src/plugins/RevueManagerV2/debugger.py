@@ -1,7 +1,10 @@
 from functools import wraps
 import traceback
 
+from .metrics import metrics
 
+
+#   Catch the exceptions of a controller method and record its call in metrics
 def debugger(func):
     @wraps(func)
     async def exception_wrapper(*args, **kwargs):
@@ -11,14 +14,20 @@ def debugger(func):
             'func_info': func_info
         }
 
+        token = metrics.start()
+        error = True
         try:
-            response = await func(*args, **kwargs)
-            result['response'] = response
-            result['error'] = None
-        except Exception as e:
-            result['response'] = None
-            result['error'] = traceback.format_exc()
+            try:
+                response = await func(*args, **kwargs)
+                result['response'] = response
+                result['error'] = None
+                error = False
+            except Exception as e:
+                result['response'] = None
+                result['error'] = traceback.format_exc()
         finally:
-            return result
+            #   A cancelled call is recorded as failed and the cancellation propagates
+            metrics.finish(func_info, token, error)
+        return result
 
     return exception_wrapper
@@ -0,0 +1,90 @@
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from .metrics import metrics
+from .slowlog import slow_queries
+
+
+#   Apply connection level settings on every new sqlite connection
+#   WAL lets readers proceed while a single writer holds the lock,
+#   busy_timeout makes writers wait for the lock instead of failing immediately
+def _sqlite_connect_hook(busy_timeout: int):
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout={}".format(int(busy_timeout)))
+        cursor.close()
+
+    return set_sqlite_pragma
+
+
+#   Use singleton to share one engine and one connection pool among all controllers
+class EngineRegistry(object):
+    __instance = None
+
+    def __new__(cls, db_path: str = None, pool_size: int = 5, max_overflow: int = 0,
+                pool_timeout: int = 30, busy_timeout: int = 5000):
+        if cls.__instance is None:
+            if db_path is None:
+                raise RuntimeError('EngineRegistry is used before the database is initialized.')
+
+            cls.__instance = object.__new__(cls)
+            cls.__pool_options = {
+                'pool_size': pool_size,
+                'max_overflow': max_overflow,
+                'pool_timeout': pool_timeout
+            }
+            cls.__busy_timeout = busy_timeout
+            cls.__db_path = None
+            cls.__engine = None
+            cls.__session = None
+            cls.__instance._build(db_path)
+        return cls.__instance
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    @property
+    def db_path(self) -> str:
+        return self.__db_path
+
+    @property
+    def engine(self):
+        return self.__engine
+
+    @property
+    def session(self) -> sessionmaker:
+        return self.__session
+
+    #   Swap the shared engine, every controller picks up the new one on its next query
+    async def change_database(self, db_path: str):
+        old_engine = self.__engine
+        self._build(db_path)
+
+        if old_engine is not None:
+            await old_engine.dispose()
+
+    async def dispose(self):
+        if self.__engine is not None:
+            await self.__engine.dispose()
+
+    def _build(self, db_path: str):
+        cls = type(self)
+
+        engine = create_async_engine(
+            'sqlite+aiosqlite:///' + str(db_path),
+            poolclass=AsyncAdaptedQueuePool,
+            **cls.__pool_options
+        )
+        event.listen(engine.sync_engine, 'connect', _sqlite_connect_hook(cls.__busy_timeout))
+        metrics.instrument(engine.sync_engine)
+        slow_queries.instrument(engine.sync_engine)
+
+        cls.__db_path = str(db_path)
+        cls.__engine = engine
+        cls.__session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import time
+
+from sqlalchemy import event
+
+
+#   Upper bounds in seconds of the latency buckets, from 0.5ms doubling up to about 33s
+BUCKETS = tuple(0.0005 * 2 ** i for i in range(17))
+
+
+#   Latency distribution in fixed buckets, quantiles are interpolated within a bucket
+class Histogram(object):
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(BUCKETS):
+                    return self.max
+                lower = BUCKETS[index - 1] if index else 0.0
+                return min(self.max, lower + (BUCKETS[index] - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+
+class MethodMetrics(object):
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.db_seconds = 0.0
+        self.python_seconds = 0.0
+
+
+#   Metrics of every @debugger call, keyed by the method's qualified name
+#   Time spent in database cursors is measured by engine events and charged to the asyncio task
+#   running the call, the rest of the call's time is Python overhead, which includes waiting
+#   for a pooled connection. A nested call charges its database time to the outer call as well.
+class Metrics(object):
+
+    def __init__(self):
+        self._methods = {}
+        self._db_time = {}
+
+    #   :return: token to pass to finish
+    def start(self):
+        task = self._task()
+        outer = self._db_time.get(task)
+        self._db_time[task] = 0.0
+        return task, outer, time.perf_counter()
+
+    #   :return: seconds since start, seconds of them spent in database cursors
+    def stop(self, token) -> tuple:
+        task, outer, started = token
+        elapsed = time.perf_counter() - started
+        db_seconds = self._db_time.pop(task, 0.0)
+        if outer is not None:
+            self._db_time[task] = outer + db_seconds
+        return elapsed, db_seconds
+
+    def finish(self, name: str, token, error: bool):
+        elapsed, db_seconds = self.stop(token)
+
+        method = self._methods.get(name)
+        if method is None:
+            method = self._methods[name] = MethodMetrics(name)
+        method.calls += 1
+        method.errors += error
+        method.latency.observe(elapsed)
+        method.db_seconds += db_seconds
+        method.python_seconds += max(0.0, elapsed - db_seconds)
+
+    #   Charge database time to the call running in the current task, e.g. its share of a batched write
+    def add_db_time(self, seconds: float):
+        task = self._task()
+        if task in self._db_time:
+            self._db_time[task] += seconds
+
+    #   Time every cursor execution of a sync engine, e.g. AsyncEngine.sync_engine
+    def instrument(self, engine):
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            self.add_db_time(time.perf_counter() - conn.info['metrics_start'].pop())
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    def reset(self):
+        self._methods.clear()
+
+    #   Per method statistics, slowest in total first, times in milliseconds
+    def snapshot(self) -> list:
+        result = []
+        for method in sorted(self._methods.values(), key=lambda item: -item.latency.sum):
+            result.append({
+                'name': method.name,
+                'calls': method.calls,
+                'errors': method.errors,
+                'p50': round(method.latency.quantile(0.5) * 1000, 2),
+                'p95': round(method.latency.quantile(0.95) * 1000, 2),
+                'p99': round(method.latency.quantile(0.99) * 1000, 2),
+                'total': round(method.latency.sum * 1000, 2),
+                'db': round(method.db_seconds * 1000, 2),
+                'python': round(method.python_seconds * 1000, 2)
+            })
+        return result
+
+    #   Prometheus text exposition format
+    def prometheus(self) -> str:
+        lines = [
+            '# HELP revue_calls_total Calls of controller methods.',
+            '# TYPE revue_calls_total counter'
+        ]
+        methods = sorted(self._methods.values(), key=lambda item: item.name)
+        for method in methods:
+            lines.append('revue_calls_total{{method="{}"}} {}'.format(method.name, method.calls))
+
+        lines.append('# HELP revue_errors_total Controller method calls that raised.')
+        lines.append('# TYPE revue_errors_total counter')
+        for method in methods:
+            lines.append('revue_errors_total{{method="{}"}} {}'.format(method.name, method.errors))
+
+        lines.append('# HELP revue_db_seconds_total Time controller methods spent in database cursors.')
+        lines.append('# TYPE revue_db_seconds_total counter')
+        for method in methods:
+            lines.append('revue_db_seconds_total{{method="{}"}} {}'.format(method.name, method.db_seconds))
+
+        lines.append('# HELP revue_python_seconds_total Time controller methods spent outside database cursors.')
+        lines.append('# TYPE revue_python_seconds_total counter')
+        for method in methods:
+            lines.append('revue_python_seconds_total{{method="{}"}} {}'.format(method.name, method.python_seconds))
+
+        lines.append('# HELP revue_call_seconds Latency of controller method calls.')
+        lines.append('# TYPE revue_call_seconds histogram')
+        for method in methods:
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float('inf'),), method.latency.counts):
+                cumulative += count
+                lines.append('revue_call_seconds_bucket{{method="{}",le="{}"}} {}'.format(
+                    method.name, '+Inf' if bound == float('inf') else repr(bound), cumulative
+                ))
+            lines.append('revue_call_seconds_sum{{method="{}"}} {}'.format(method.name, method.latency.sum))
+            lines.append('revue_call_seconds_count{{method="{}"}} {}'.format(method.name, method.latency.count))
+
+        return '\n'.join(lines) + '\n'
+
+    #   Write the Prometheus text to path, replaced atomically for the node exporter's textfile collector
+    def export(self, path):
+        temporary = str(path) + '.tmp'
+        with open(temporary, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(temporary, path)
+
+    @staticmethod
+    def _task():
+        try:
+            return asyncio.current_task()
+        except RuntimeError:
+            return None
+
+
+metrics = Metrics()
@@ -3,7 +3,8 @@ from sqlalchemy import (
     Column,
     Integer,
     String,
-    ForeignKey
+    ForeignKey,
+    Index
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -109,6 +110,45 @@ class Team(Base):
             self.record_id, self.member_id, self.team_id, self.team_list, self.us_list
         )
 
+
+#   Damage totals per member, boss and game day, derived from RevueRecord
+#   Maintained by RecordController in the same transaction as the records themselves
+#   game_day is the local date of the game day in YYYYMMDD form, a game day starts at 4:00
+class DailyDamageRollup(Base):
+    __tablename__ = "DailyDamageRollup"
+
+    member_id = Column(String, primary_key=True)
+    boss_id = Column(Integer, primary_key=True)
+    game_day = Column(Integer, primary_key=True)
+    total_damage = Column(Integer)
+    hit_count = Column(Integer)
+    max_hit = Column(Integer)
+    turns_used = Column(Integer)
+
+    def __init__(self, member_id: str, boss_id: int, game_day: int,
+                 total_damage: int, hit_count: int, max_hit: int, turns_used: int):
+        self.member_id = member_id
+        self.boss_id = boss_id
+        self.game_day = game_day
+        self.total_damage = total_damage
+        self.hit_count = hit_count
+        self.max_hit = max_hit
+        self.turns_used = turns_used
+
+    def __repr__(self):
+        return '<DailyDamageRollup (member_id: {}, boss_id: {}, game_day: {}, total_damage: {}, ' \
+               'hit_count: {}, max_hit: {}, turns_used: {})>'.format(
+                self.member_id, self.boss_id, self.game_day, self.total_damage,
+                self.hit_count, self.max_hit, self.turns_used)
+
+
+#   Indexes for searching records by member/boss within a time range
+#   Use data_source.migrate_database to create them on an existing database
+Index('ix_RevueRecord_member_date', Record.member_id, Record.date_time)
+Index('ix_RevueRecord_boss_date_damage', Record.boss_id, Record.date_time, Record.damage.desc())
+Index('ix_TeamRecord_member_team', Team.member_id, Team.team_id)
+Index('ix_DailyDamageRollup_day_boss', DailyDamageRollup.game_day, DailyDamageRollup.boss_id)
+
 #   Deprecated test function
 #
 # async def _reset_database(database_path: Path = None):
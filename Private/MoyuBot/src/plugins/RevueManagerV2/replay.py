@@ -0,0 +1,189 @@
+#   Replay captured group messages through the bot's matchers without a QQ connection
+#   Capture by setting EVENT_CAPTURE_PATH in the bot's .env, every group message is appended to that file.
+#   Run in a copy of the bot directory, replayed commands write to its database, e.g.
+#       python src/plugins/RevueManagerV2/replay.py events.jsonl --speed 10 --output replay.json
+#   --speed 1 keeps the captured pace, 10 is ten times faster, max sends every event at once.
+#   Reported per command: end-to-end latency from receiving the event until every matcher finished
+#   (argument parsing, database and formatting included) and latency until the first reply.
+#   replay_cases holds recorded conversations of fixed bugs, replay them into an empty database with
+#   SUPERUSERS=["100"] and check the replies, e.g.
+#       paged_search.jsonl: /lb sent while /sr.m waits for the next page is answered
+import argparse
+import asyncio
+import contextvars
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import nonebot
+import nonebot.adapters.cqhttp as cqhttp
+from nonebot.message import run_postprocessor
+
+PLUGIN_DIRECTORY = Path(__file__).resolve().parent.parent
+
+#   The replayed event running in the current task, matchers are run in tasks copying this context
+current_event = contextvars.ContextVar('current_event', default=None)
+
+
+#   Latency summary in milliseconds
+def _summary(latencies: list) -> dict:
+    if not latencies:
+        return {'count': 0}
+
+    ordered = sorted(latencies)
+    return {
+        'count': len(ordered),
+        'p50': round(statistics.median(ordered) * 1000, 3),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        'p99': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+        'max': round(ordered[-1] * 1000, 3)
+    }
+
+
+#   Bot answering every API call itself, outgoing messages are recorded instead of sent
+class StubBot(cqhttp.Bot):
+
+    def __init__(self, self_id: str):
+        super().__init__('websocket', self_id)
+        self.sent = []
+        self._message_id = 0
+
+    async def _call_api(self, api: str, **data):
+        entry = current_event.get()
+        if entry is not None:
+            if entry['first_reply'] is None:
+                entry['first_reply'] = time.perf_counter() - entry['start']
+            entry['replies'] += 1
+        self.sent.append({'event': entry['index'] if entry else None, 'api': api, 'data': data})
+
+        if api.startswith('send'):
+            self._message_id += 1
+            return {'message_id': self._message_id}
+        return {}
+
+
+def _read_events(path: str) -> list:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+#   The command of a message, e.g. /ar, or other for chat
+def _command(payload: dict, command_start: set) -> str:
+    text = (payload.get('raw_message') or '').strip()
+    for start in sorted(command_start, key=len, reverse=True):
+        if start and text.startswith(start):
+            return text.split(maxsplit=1)[0] if text else 'other'
+    return 'other'
+
+
+async def replay(events: list, speed: float, bot: StubBot) -> dict:
+    command_start = nonebot.get_driver().config.command_start
+    entries = []
+    errors = {}
+
+    @run_postprocessor
+    async def count_errors(matcher, exception, bot, event, state):
+        if exception is not None:
+            entry = current_event.get()
+            command = entry['command'] if entry else 'other'
+            errors[command] = errors.get(command, 0) + 1
+
+    async def dispatch(index: int, payload: dict):
+        entry = {
+            'index': index,
+            'command': _command(payload, command_start),
+            'start': time.perf_counter(),
+            'first_reply': None,
+            'replies': 0
+        }
+        current_event.set(entry)
+        await bot.handle_message(payload)
+        entry['latency'] = time.perf_counter() - entry['start']
+        entries.append(entry)
+
+    loop = asyncio.get_running_loop()
+    first = events[0].get('timestamp', events[0]['event']['time'])
+    start = loop.time()
+    tasks = []
+    for index, line in enumerate(events):
+        if speed:
+            due = start + (line.get('timestamp', line['event']['time']) - first) / speed
+            if due > loop.time():
+                await asyncio.sleep(due - loop.time())
+        #   Events arrive regardless of earlier ones still being handled, as they do from the chat
+        tasks.append(asyncio.ensure_future(dispatch(index, line['event'])))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - start
+
+    commands = {}
+    for entry in entries:
+        commands.setdefault(entry['command'], []).append(entry)
+
+    return {
+        'events': len(entries),
+        'speed': speed or 'max',
+        'elapsed': round(elapsed, 3),
+        'throughput': round(len(entries) / elapsed, 1) if elapsed else None,
+        'replies': len(bot.sent),
+        'commands': {
+            command: {
+                'latency': _summary([entry['latency'] for entry in group]),
+                'first_reply': _summary([entry['first_reply'] for entry in group if entry['first_reply'] is not None]),
+                'replies': sum(entry['replies'] for entry in group),
+                'errors': errors.get(command, 0)
+            }
+            for command, group in sorted(commands.items())
+        }
+    }
+
+
+async def run(args) -> dict:
+    events = _read_events(args.events)
+    if not events:
+        raise ValueError('No events in {}'.format(args.events))
+
+    driver = nonebot.get_driver()
+    #   Startup hooks open the databases as the bot does
+    await driver.server_app.router.startup()
+    try:
+        bot = StubBot(str(args.self_id or events[0]['self_id']))
+        driver._bot_connect(bot)
+        report = await replay(events, 0 if args.speed == 'max' else float(args.speed), bot)
+        driver._bot_disconnect(bot)
+    finally:
+        await driver.server_app.router.shutdown()
+
+    if args.replies:
+        with open(args.replies, 'w', encoding='utf-8') as f:
+            for message in bot.sent:
+                f.write(json.dumps(message, ensure_ascii=False, default=str) + '\n')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay captured group messages through the matchers')
+    parser.add_argument('events', help='JSONL file written by the event capture')
+    parser.add_argument('--speed', default='1', help='1 for the captured pace, 10 for ten times faster, or max')
+    parser.add_argument('--plugins', nargs='+', default=['GameResourceManager', 'RevueManagerV2'])
+    parser.add_argument('--self-id', help='bot account answering, the captured one by default')
+    parser.add_argument('--replies', help='write the outgoing messages to this JSONL file')
+    parser.add_argument('--output', help='also write the report to this file, e.g. to compare releases')
+    args = parser.parse_args()
+
+    #   Settings come from the .env of the working directory as for the bot, without capturing the replay itself
+    nonebot.init(event_capture_path='')
+    nonebot.get_driver().register_adapter('cqhttp', cqhttp.Bot)
+    sys.path.insert(0, str(PLUGIN_DIRECTORY))
+    for plugin in args.plugins:
+        nonebot.load_plugin(plugin)
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import logging
+import time
+
+from sqlalchemy import event
+
+
+logger = logging.getLogger('RevueManagerV2.slow_query')
+
+REDACTED = '***'
+
+#   Statements sqlite can explain, schema changes can not
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+class QueryStats(object):
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.calls = 0
+        self.slow_calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        #   Parameters of the slowest call, redacted
+        self.parameters = None
+        self.plan = None
+
+
+#   Statement timings of the engines, grouped by statement text
+#   Bound values are not part of the text, so every call of a controller query lands in the same entry.
+#   Statements slower than threshold are logged with their redacted parameters, and the first slow call
+#   of a statement captures its EXPLAIN QUERY PLAN on the same connection.
+#   Only the capacity statements with the largest total time are kept, the rest are dropped as they fall behind.
+#   :param threshold: seconds
+class SlowQueryLog(object):
+
+    def __init__(self, threshold: float = 0.1, capacity: int = 200, explain: bool = True):
+        self.threshold = threshold
+        self.capacity = max(1, int(capacity))
+        self.explain = explain
+        self._statements = {}
+
+    #   Time every cursor execution of a sync engine, e.g. AsyncEngine.sync_engine
+    def instrument(self, engine):
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['slow_query_start'].pop()
+            self.record(conn, statement, parameters, context, executemany, elapsed)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    def record(self, conn, statement: str, parameters, context, executemany: bool, elapsed: float):
+        stats = self._statements.get(statement)
+        if stats is None:
+            stats = self._statements[statement] = QueryStats(statement)
+            if len(self._statements) > self.capacity:
+                self._evict(stats)
+
+        stats.calls += 1
+        stats.total += elapsed
+
+        slow = elapsed >= self.threshold
+        if slow:
+            stats.slow_calls += 1
+            redacted = self._redact(statement, parameters, context, executemany)
+        if elapsed >= stats.max:
+            stats.max = elapsed
+            if slow:
+                stats.parameters = redacted
+
+        if slow:
+            #   Logged with its own parameters, stats keeps those of the slowest call
+            logger.warning('Slow query ({:.1f}ms): {} {}'.format(elapsed * 1000, statement, redacted))
+            if self.explain and stats.plan is None and statement.split(None, 1)[0].upper() in EXPLAINABLE:
+                stats.plan = self._explain(conn, statement, parameters, executemany)
+
+    #   The worst statements by total time
+    def top(self, n: int = 10) -> list:
+        return sorted(self._statements.values(), key=lambda item: -item.total)[:n]
+
+    def reset(self):
+        self._statements.clear()
+
+    #   Drop the statement with the least total time, except the one just added so it can catch up
+    def _evict(self, keep: QueryStats):
+        victim = min((stats for stats in self._statements.values() if stats is not keep), key=lambda item: item.total)
+        del self._statements[victim.statement]
+
+    #   Bound values with the passwords replaced
+    #   Compiled statements name their positional parameters, plain text statements touching a password
+    #   column are redacted as a whole
+    @staticmethod
+    def _redact(statement: str, parameters, context, executemany: bool):
+        rows = parameters if executemany else [parameters]
+        names = getattr(getattr(context, 'compiled', None), 'positiontup', None)
+
+        redacted = []
+        for row in rows:
+            if isinstance(row, dict):
+                redacted.append({
+                    key: REDACTED if 'password' in str(key).lower() else value for key, value in row.items()
+                })
+            elif names is not None and len(names) == len(row):
+                redacted.append(tuple(
+                    REDACTED if 'password' in name.lower() else value for name, value in zip(names, row)
+                ))
+            elif 'password' in statement.lower():
+                redacted.append(tuple(REDACTED for _ in row))
+            else:
+                redacted.append(tuple(row))
+
+        if executemany:
+            #   Enough to reproduce the statement without flooding the log
+            return redacted[:3] + (['... {} rows'.format(len(redacted))] if len(redacted) > 3 else [])
+        return redacted[0]
+
+    #   EXPLAIN QUERY PLAN of a statement, run on the raw connection so it is not timed itself
+    @staticmethod
+    def _explain(conn, statement: str, parameters, executemany: bool) -> list:
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        try:
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+                return [row[-1] for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except Exception as e:
+            return ['EXPLAIN failed: {}'.format(e)]
+
+
+slow_queries = SlowQueryLog()